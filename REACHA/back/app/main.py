@@ -8,26 +8,35 @@ import os
 import sys
 import uuid
 import threading
+import asyncio
 import time
 import subprocess
 import json
 import logging
 import re
-from typing import List, Optional, Dict, Any, Tuple
+import random
+import functools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 import base64
 import binascii
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from starlette.responses import FileResponse
 import shutil
-import requests
-from requests.exceptions import RequestException, Timeout, ConnectionError as RequestsConnectionError
+import anyio
+import httpx
+import orjson
 from dotenv import load_dotenv
-import traceback
 
 # Setup logging
 logging.basicConfig(
@@ -58,13 +67,20 @@ DIFY_USER_ID = os.getenv("DIFY_USER_ID", "REACHA_agent")
 DIFY_TIMEOUT = int(os.getenv("DIFY_TIMEOUT", "10800"))
 DIFY_MAX_RETRIES = int(os.getenv("DIFY_MAX_RETRIES", "3"))
 DIFY_RETRY_BACKOFF_SECONDS = int(os.getenv("DIFY_RETRY_BACKOFF_SECONDS", "10"))
+DIFY_RETRY_BACKOFF_CAP_SECONDS = int(os.getenv("DIFY_RETRY_BACKOFF_CAP_SECONDS", "60"))
 DIFY_INTER_QUERY_DELAY_SECONDS = int(os.getenv("DIFY_INTER_QUERY_DELAY_SECONDS", "8"))
+# SSE events that carry no text and are dropped without a JSON parse
+DIFY_SSE_SKIP_EVENTS = [e.strip() for e in os.getenv("DIFY_SSE_SKIP_EVENTS", "ping,message_end").split(",") if e.strip()]
 HISTORY_LIMIT = int(os.getenv("EDIT_HISTORY_LIMIT", "10"))
 
 # Dify API Endpoints
 DIFY_CHAT_ENDPOINT = "https://api.dify.ai/v1/chat-messages"
 DIFY_WORKFLOW_ENDPOINT = "https://api.dify.ai/v1/workflows/run"
 
+# Request headers are invariant for the process lifetime, so they are built once
+DIFY_CHAT_HEADERS = {"Authorization": f"Bearer {DIFY_API_KEY1}", "Content-Type": "application/json"}
+DIFY_WORKFLOW_HEADERS = {"Authorization": f"Bearer {DIFY_API_KEY2}", "Content-Type": "application/json"}
+
 QUERIES: List[str] = [
     "事業の全体像",
     "外部環境と市場評価",
@@ -73,69 +89,119 @@ QUERIES: List[str] = [
     "世間の評価",
 ]
 
+# QUERIES is fixed at startup, so the per-index file name suffixes are built once:
+# (txt, md, edited_txt, edited_md, history) for each index
+_INDEX_RANGE = range(1, len(QUERIES) + 1)
+_RESULT_SUFFIXES: Tuple[Tuple[str, str, str, str, str], ...] = tuple(
+    (f"_{i}.txt", f"_{i}.md", f"_{i}_edited.txt", f"_{i}_edited.md", f"_{i}_history.json")
+    for i in _INDEX_RANGE
+)
+_SUFFIX_PAIRS: Tuple[Tuple[str, str], ...] = tuple((s[0], s[1]) for s in _RESULT_SUFFIXES)
+
 
 # ----------------------
 # Long-run tuning
 # ----------------------
 MAX_RUN_SECONDS = int(os.getenv("MAX_RUN_SECONDS", str(3 * 60 * 60)))  # 3h
 HEARTBEAT_STALE_SECONDS = int(os.getenv("HEARTBEAT_STALE_SECONDS", "60"))  # 1m
+HEARTBEAT_DEBOUNCE_SECONDS = 5.0  # heartbeat touches closer together than this are skipped
+PROGRESS_WRITE_INTERVAL_SECONDS = 0.5  # minimum gap between proposal progress writes
+
+# Proposal part cache: Dify workflow output keyed by the SHA-256 of the cleaned research text
+PROPOSAL_CACHE_ENABLED = os.getenv("PROPOSAL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PROPOSAL_CACHE_TTL_SECONDS = int(os.getenv("PROPOSAL_CACHE_TTL_SECONDS", "0"))  # 0 = never expire
+# Namespaced by workflow key, so switching DIFY_API_KEY2 never serves another workflow's output
+PROPOSAL_CACHE_DIR = os.path.join(
+    OUTPUTS_ROOT, ".cache", hashlib.sha256(DIFY_API_KEY2.encode("utf-8")).hexdigest()[:16]
+)
+# Research files sent to the Dify workflow at the same time while creating a proposal
+PROPOSAL_CONCURRENCY = max(1, int(os.getenv("PROPOSAL_CONCURRENCY", "3")))
 
 
 # ----------------------
 # Process state
 # ----------------------
+class DummyProcess:
+    """Popen-like wrapper around the job thread, for compatibility with existing monitoring code."""
+
+    __slots__ = ("thread",)
+
+    def __init__(self, thread: threading.Thread):
+        self.thread = thread
+
+    def poll(self):
+        return None if self.thread.is_alive() else 0
+
+
+class RunState(NamedTuple):
+    job_id: Optional[str] = None
+    company: Optional[str] = None
+    process: Optional[Any] = None  # Can be subprocess.Popen or DummyProcess
+    thread: Optional[threading.Thread] = None
+
+
+# Immutable snapshot of the current job. Readers take `run_state` without
+# locking (a single reference load); writers swap it while holding state_lock.
 state_lock = threading.Lock()
-running_process: Optional[Any] = None  # Can be subprocess.Popen or DummyProcess
-running_thread: Optional[threading.Thread] = None
-running_company: Optional[str] = None
-running_job_id: Optional[str] = None
+run_state: RunState = RunState()
+
+# Proposal generations started by streaming requests; held so they outlive a disconnect
+_proposal_tasks: Set["asyncio.Task[str]"] = set()
+
+
+def _alive(snapshot: RunState) -> bool:
+    """True while the snapshot's job process/thread is still running."""
+    p = snapshot.process
+    return p is not None and p.poll() is None
 
 
 def ensure_outputs_root() -> None:
     os.makedirs(OUTPUTS_ROOT, exist_ok=True)
 
 
+@functools.lru_cache(maxsize=256)
 def company_dir(company: str) -> str:
+    # Pure function of the name (OUTPUTS_ROOT is fixed at startup), hit on every poll
     return os.path.join(OUTPUTS_ROOT, company)
 
 
+# URL patterns found in the research files, precompiled once. They are applied in
+# this order, one pass each: a Markdown link must be reduced to its label before
+# the bare-URL patterns run, or a bare URL would swallow a following "[label".
+# - ([www.example.com](https://example.com/path#:~:text=...))
+# - [text](https://example.com/path)
+# - (https://example.com/path) / (www.example.com)
+# - [https://example.com/path] / [www.example.com]
+# - https://example.com/path / www.example.com
+_URL_SUBS: Tuple[Tuple["re.Pattern[str]", str], ...] = (
+    (re.compile(r'\(\[www\.[^\]]+\]\(https?://[^\)]+\)\)'), ''),
+    (re.compile(r'\[([^\]]+)\]\(https?://[^\)]+\)'), r'\1'),
+    (re.compile(r'\(https?://[^\)]+\)'), ''),
+    (re.compile(r'\(www\.[^\)]+\)'), ''),
+    (re.compile(r'\[https?://[^\]]+\]'), ''),
+    (re.compile(r'\[www\.[^\]]+\]'), ''),
+    (re.compile(r'https?://[^\s\)\]\(]+(?:#:~:text=[^\s\)\]\(]+)?'), ''),
+    (re.compile(r'\bwww\.[^\s\)\]\(]+'), ''),
+)
+# Whitespace and punctuation cleanup, in the same order
+_CLEANUP_SUBS: Tuple[Tuple["re.Pattern[str]", str], ...] = (
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\s+\.'), '.'),
+    (re.compile(r'\s+,'), ','),
+    (re.compile(r'\s+\)'), ')'),
+    (re.compile(r'\(\s+'), '('),
+)
+
+
 def remove_urls_from_text(text: str) -> str:
     """Remove URLs from text content."""
-    # Pattern to match various URL formats found in the text files:
-    # - ([www.example.com](https://example.com/path#:~:text=...))
-    # - ([www.example.com](https://example.com/path))
-    # - (https://example.com/path)
-    # - [text](https://example.com/path)
-    # - https://example.com/path
-    
-    # Remove nested Markdown links in parentheses: ([www.example.com](https://...))
-    text = re.sub(r'\(\[www\.[^\]]+\]\(https?://[^\)]+\)\)', '', text)
-    
-    # Remove Markdown links: [text](url) - keep the text, remove the URL
-    text = re.sub(r'\[([^\]]+)\]\(https?://[^\)]+\)', r'\1', text)
-    
-    # Remove URLs in parentheses: (https://...) or (www....)
-    text = re.sub(r'\(https?://[^\)]+\)', '', text)
-    text = re.sub(r'\(www\.[^\)]+\)', '', text)
-    
-    # Remove URLs in square brackets: [https://...] or [www....]
-    text = re.sub(r'\[https?://[^\]]+\]', '', text)
-    text = re.sub(r'\[www\.[^\]]+\]', '', text)
-    
-    # Remove standalone URLs (http://, https://) with optional fragments
-    text = re.sub(r'https?://[^\s\)\]\(]+(?:#:~:text=[^\s\)\]\(]+)?', '', text)
-    
-    # Remove standalone www. URLs
-    text = re.sub(r'\bwww\.[^\s\)\]\(]+', '', text)
-    
+    for pattern, repl in _URL_SUBS:
+        text = pattern.sub(repl, text)
+
     # Clean up multiple spaces and punctuation issues
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'\s+\.', '.', text)
-    text = re.sub(r'\s+,', ',', text)
-    text = re.sub(r'\s+\)', ')', text)
-    text = re.sub(r'\(\s+', '(', text)
-    text = re.sub(r'\s+\)', ')', text)
-    
+    for pattern, repl in _CLEANUP_SUBS:
+        text = pattern.sub(repl, text)
+
     return text.strip()
 
 
@@ -145,60 +211,156 @@ def list_companies() -> List[str]:
         return [
             name
             for name in os.listdir(OUTPUTS_ROOT)
-            if os.path.isdir(os.path.join(OUTPUTS_ROOT, name))
+            if not name.startswith(".") and os.path.isdir(os.path.join(OUTPUTS_ROOT, name))
         ]
     except FileNotFoundError:
         return []
 
 
-def read_results(company: str) -> Dict[str, Any]:
-    """Read up to len(QUERIES) result pairs from disk and compute status/progress."""
+def _company_files(company: str) -> Set[str]:
+    """Names of the regular files in the company directory, from one scandir."""
+    try:
+        with os.scandir(company_dir(company)) as it:
+            return {e.name for e in it if e.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
+def _read_text_or_none(path: str) -> Optional[str]:
+    """Read a UTF-8 file with a single positional read; None if it does not exist."""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    except FileNotFoundError:
+        return None
+    try:
+        size = os.fstat(fd).st_size
+        if hasattr(os, "pread"):
+            data = os.pread(fd, size, 0)
+        else:  # Windows
+            data = os.read(fd, size)
+    finally:
+        os.close(fd)
+    text = data.decode("utf-8")
+    # Match text-mode universal newlines
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+ResultsSignature = Tuple[Tuple[str, int, int], ...]
+ResultFiles = Tuple[List[Dict[str, Any]], int, bool]  # items, completed count, has proposal
+
+# Last read per company, keyed by directory signature. Items are shared between
+# responses and must not be mutated. Bounded LRU: company names are user input.
+_RESULTS_CACHE_SIZE = 64
+_results_cache: "OrderedDict[str, Tuple[ResultsSignature, ResultFiles]]" = OrderedDict()
+_results_cache_lock = threading.Lock()
+
+
+def _cached_results(company: str, signature: ResultsSignature) -> Optional[ResultFiles]:
+    with _results_cache_lock:
+        cached = _results_cache.get(company)
+        if cached is None or cached[0] != signature:
+            return None
+        _results_cache.move_to_end(company)
+        return cached[1]
+
+
+def _store_results(company: str, signature: ResultsSignature, files: ResultFiles) -> None:
+    with _results_cache_lock:
+        _results_cache[company] = (signature, files)
+        _results_cache.move_to_end(company)
+        while len(_results_cache) > _RESULTS_CACHE_SIZE:
+            _results_cache.popitem(last=False)
+
+
+def _forget_results(company: str) -> None:
+    with _results_cache_lock:
+        _results_cache.pop(company, None)
+
+
+def _results_signature(company: str) -> ResultsSignature:
+    """(name, mtime_ns, size) of every result-related file, from one scandir pass."""
+    wanted = {company + suffix for suffixes in _RESULT_SUFFIXES for suffix in suffixes}
+    wanted.add(f"{company}_proposal.txt")
+    entries = []
+    try:
+        with os.scandir(company_dir(company)) as it:
+            for e in it:
+                if e.name in wanted:
+                    st = e.stat()
+                    entries.append((e.name, st.st_mtime_ns, st.st_size))
+    except FileNotFoundError:
+        pass
+    return tuple(sorted(entries))
+
+
+# Overlaps per-file read latency (noticeable on network filesystems)
+_READ_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="reach-read")
+_PARALLEL_READ_MIN = 3  # below this, submit overhead outweighs the overlap
+
+
+def _read_result_files(company: str, signature: ResultsSignature) -> ResultFiles:
+    """Read result files for the given directory signature."""
     dir_path = company_dir(company)
+    present = {name for name, _, _ in signature}
     items = []
     completed_count = 0
-    total = len(QUERIES)
 
-    for i in range(1, total + 1):
-        base = f"{company}_{i}"
-        txt_path = os.path.join(dir_path, f"{base}.txt")
-        md_path = os.path.join(dir_path, f"{base}.md")
-        edited_txt_path = os.path.join(dir_path, f"{base}_edited.txt")
-        edited_md_path = os.path.join(dir_path, f"{base}_edited.md")
-        history_path = os.path.join(dir_path, f"{base}_history.json")
+    # Files missing from the scandir listing are not opened at all
+    names = [company + suffix for suffixes in _RESULT_SUFFIXES for suffix in suffixes if company + suffix in present]
+    contents: Dict[str, Any] = {}  # name -> text, or the exception raised while reading it
+    if len(names) < _PARALLEL_READ_MIN:
+        for name in names:
+            try:
+                contents[name] = _read_text_or_none(os.path.join(dir_path, name))
+            except Exception as e:
+                contents[name] = e
+    else:
+        futures = [(name, _READ_POOL.submit(_read_text_or_none, os.path.join(dir_path, name))) for name in names]
+        for name, fut in futures:
+            try:
+                contents[name] = fut.result()
+            except Exception as e:
+                contents[name] = e
+
+    def _read(name: str) -> Optional[str]:
+        value = contents.get(name)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    for i, (txt_suf, md_suf, edited_txt_suf, edited_md_suf, history_suf) in zip(_INDEX_RANGE, _RESULT_SUFFIXES):
         text = ""
         md = ""
         orig_text = ""
         orig_md = ""
         edited = False
 
-        if os.path.exists(txt_path):
-            try:
-                with open(txt_path, "r", encoding="utf-8") as f:
-                    orig_text = f.read()
-            except Exception:
-                text = ""
-        if os.path.exists(md_path):
-            try:
-                with open(md_path, "r", encoding="utf-8") as f:
-                    orig_md = f.read()
-            except Exception:
-                md = ""
+        try:
+            orig_text = _read(company + txt_suf) or ""
+        except Exception:
+            orig_text = ""
+        try:
+            orig_md = _read(company + md_suf) or ""
+        except Exception:
+            orig_md = ""
 
         # Prefer edited content if exists
-        if os.path.exists(edited_txt_path):
-            try:
-                with open(edited_txt_path, "r", encoding="utf-8") as f:
-                    text = f.read()
+        try:
+            edited_text = _read(company + edited_txt_suf)
+            if edited_text is not None:
+                text = edited_text
                 edited = True
-            except Exception:
-                pass
-        if os.path.exists(edited_md_path):
-            try:
-                with open(edited_md_path, "r", encoding="utf-8") as f:
-                    md = f.read()
+        except Exception:
+            pass
+        try:
+            edited_md = _read(company + edited_md_suf)
+            if edited_md is not None:
+                md = edited_md
                 edited = True
-            except Exception:
-                pass
+        except Exception:
+            pass
 
         # If no edited content, fall back to original
         if not text and orig_text:
@@ -207,14 +369,14 @@ def read_results(company: str) -> Dict[str, Any]:
             md = orig_md
 
         history_count = 0
-        if os.path.exists(history_path):
-            try:
-                with open(history_path, "r", encoding="utf-8") as f:
-                    hist = json.load(f)
-                    if isinstance(hist, list):
-                        history_count = len(hist)
-            except Exception:
-                history_count = 0
+        try:
+            raw_hist = _read(company + history_suf)
+            if raw_hist is not None:
+                hist = json.loads(raw_hist)
+                if isinstance(hist, list):
+                    history_count = len(hist)
+        except Exception:
+            history_count = 0
 
         has_any = bool(text) or bool(md)
         if has_any:
@@ -233,13 +395,25 @@ def read_results(company: str) -> Dict[str, Any]:
             }
         )
 
-    # Determine running state from memory first, then fall back to disk markers
-    with state_lock:
-        if running_company == company and running_process is not None:
-            poll_result = running_process.poll()
-            mem_running = poll_result is None
-        else:
-            mem_running = False
+    proposal_name = f"{company}_proposal.txt"
+    has_proposal = any(name == proposal_name and size > 0 for name, _, size in signature)
+
+    return items, completed_count, has_proposal
+
+
+def read_results(company: str) -> Dict[str, Any]:
+    """Read up to len(QUERIES) result pairs from disk and compute status/progress."""
+    signature = _results_signature(company)
+    files = _cached_results(company, signature)
+    if files is None:
+        files = _read_result_files(company, signature)
+        _store_results(company, signature, files)
+    items, completed_count, has_proposal = files
+    total = len(QUERIES)
+
+    # Running state depends on memory and heartbeat age, so it is never cached
+    snapshot = run_state
+    mem_running = snapshot.company == company and _alive(snapshot)
 
     disk = _read_disk_state(company)
     is_running = mem_running or (
@@ -252,11 +426,7 @@ def read_results(company: str) -> Dict[str, Any]:
 
     status = "running" if is_running else ("completed" if completed_count > 0 or disk.get("done", False) else "not_found")
     progress = {"completed": completed_count, "total": total}
-    
-    # Check if proposal file exists
-    proposal_txt_path = os.path.join(dir_path, f"{company}_proposal.txt")
-    has_proposal = os.path.exists(proposal_txt_path) and os.path.getsize(proposal_txt_path) > 0
-    
+
     return {
         "company": company,
         "status": status,
@@ -282,14 +452,23 @@ class EditRequest(BaseModel):
     markdown: Optional[str] = ""
 
 
-app = FastAPI()
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+    yield
+    # Shutdown: release the pooled Dify connections (workflow and chat clients)
+    await _close_dify_client()
+    await anyio.to_thread.run_sync(_dify_chat_client.close)
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=_lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[FRONT_ORIGIN],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Explicit lists let Starlette answer preflights with precomputed headers
+    allow_methods=("GET", "POST", "DELETE", "OPTIONS"),
+    allow_headers=("authorization", "content-type", "x-api-token"),
 )
 
 
@@ -300,7 +479,7 @@ app.add_middleware(
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions with proper logging."""
     logger.warning(f"HTTP exception: {exc.status_code} - {exc.detail} - Path: {request.url.path}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail}
     )
@@ -309,12 +488,11 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Catch-all exception handler to prevent server crashes."""
-    error_msg = str(exc)
-    error_trace = traceback.format_exc()
-    logger.error(f"Unhandled exception: {error_msg}\n{error_trace}\nPath: {request.url.path}")
+    # exc_info lets logging format the traceback only when a handler emits the record
+    logger.error("Unhandled exception: %s - Path: %s", exc, request.url.path, exc_info=exc)
     
     # Don't expose internal error details in production
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "内部エラーが発生しました。ログを確認してください。"}
     )
@@ -329,6 +507,17 @@ AUTH_TOKEN = os.getenv("AUTH_TOKEN")  # Bearer or X-API-Token
 
 AUTH_ENABLED = (bool(BASIC_USER and BASIC_PASS) or bool(AUTH_TOKEN))
 
+# Precomputed once: credentials are compared as bytes with hmac.compare_digest (constant time),
+# and the expected Basic token lets the success path skip base64 decoding
+_AUTH_TOKEN_BYTES = AUTH_TOKEN.encode("utf-8") if AUTH_TOKEN else b""
+_BASIC_USER_BYTES = BASIC_USER.encode("utf-8") if BASIC_USER else b""
+_BASIC_PASS_BYTES = BASIC_PASS.encode("utf-8") if BASIC_PASS else b""
+_BASIC_EXPECTED_B64 = base64.b64encode(_BASIC_USER_BYTES + b":" + _BASIC_PASS_BYTES)
+
+
+def _token_matches(value: str) -> bool:
+    return hmac.compare_digest(value.encode("utf-8"), _AUTH_TOKEN_BYTES)
+
 @app.middleware("http")
 async def simple_auth_middleware(request, call_next):
     if not AUTH_ENABLED:
@@ -341,24 +530,29 @@ async def simple_auth_middleware(request, call_next):
     # Bearer token (Authorization: Bearer <token>)
     if AUTH_TOKEN and auth_header and auth_header.lower().startswith("bearer "):
         bearer = auth_header.split(" ", 1)[1].strip()
-        if bearer == AUTH_TOKEN:
+        if _token_matches(bearer):
             authorized = True
 
     # X-API-Token header
-    if AUTH_TOKEN and token_header and token_header == AUTH_TOKEN:
+    if AUTH_TOKEN and token_header and _token_matches(token_header):
         authorized = True
 
     # Basic auth (Authorization: Basic base64(user:pass))
     if not authorized and BASIC_USER and BASIC_PASS and auth_header and auth_header.lower().startswith("basic "):
-        b64 = auth_header.split(" ", 1)[1].strip()
-        try:
-            decoded = base64.b64decode(b64).decode("utf-8", errors="ignore")
-            if ":" in decoded:
-                user, pwd = decoded.split(":", 1)
-                if user == BASIC_USER and pwd == BASIC_PASS:
-                    authorized = True
-        except (binascii.Error, ValueError):
-            authorized = False
+        b64 = auth_header.split(" ", 1)[1].strip().encode("utf-8")
+        if hmac.compare_digest(b64, _BASIC_EXPECTED_B64):
+            authorized = True
+        else:
+            # Non-canonical encodings still decode to the same credentials
+            try:
+                decoded = base64.b64decode(b64)
+                if b":" in decoded:
+                    user, pwd = decoded.split(b":", 1)
+                    user_ok = hmac.compare_digest(user, _BASIC_USER_BYTES)
+                    pwd_ok = hmac.compare_digest(pwd, _BASIC_PASS_BYTES)
+                    authorized = user_ok and pwd_ok
+            except (binascii.Error, ValueError):
+                authorized = False
 
     if not authorized:
         # Prefer Basic challenge if Basic is configured, else 401 JSON
@@ -371,10 +565,10 @@ async def simple_auth_middleware(request, call_next):
 
 
 @app.get("/api/companies")
-def get_companies() -> Dict[str, Any]:
+async def get_companies() -> Dict[str, Any]:
     """Get list of all companies."""
     try:
-        companies = list_companies()
+        companies = await anyio.to_thread.run_sync(list_companies)
         return {"companies": companies}
     except Exception as e:
         logger.error(f"Error getting companies list: {str(e)}", exc_info=True)
@@ -382,37 +576,44 @@ def get_companies() -> Dict[str, Any]:
 
 
 @app.get("/api/results/{company}")
-def get_results(company: str) -> Dict[str, Any]:
+async def get_results(company: str) -> Dict[str, Any]:
     """Get results for a specific company."""
     try:
-        return read_results(company)
+        return await anyio.to_thread.run_sync(read_results, company)
     except Exception as e:
         logger.error(f"Error getting results for company {company}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"結果の取得に失敗しました: {str(e)}")
 
 
+def _remove_company_dir(company: str) -> None:
+    """Delete a company directory; it is flat, so plain unlinks cover almost everything."""
+    target_dir = company_dir(company)
+    try:
+        with os.scandir(target_dir) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    shutil.rmtree(e.path)  # unexpected subdirectory
+                else:
+                    os.unlink(e.path)
+        os.rmdir(target_dir)
+    finally:
+        # Even a partial delete changes the files, so the cached read is dropped
+        _forget_results(company)
+
+
 @app.delete("/api/results/{company}")
 def delete_results(company: str) -> Dict[str, Any]:
     """Delete results for a specific company."""
     try:
         # 競合中断: 実行中は削除させない
-        with state_lock:
-            if running_process is not None:
-                try:
-                    poll_result = running_process.poll()
-                    alive = poll_result is None
-                except Exception as e:
-                    logger.warning(f"Error checking process status: {e}")
-                    alive = False
-            else:
-                alive = False
-            if alive and running_company == company:
-                raise HTTPException(status_code=409, detail="この企業のジョブが実行中です")
+        snapshot = run_state
+        if snapshot.company == company and _alive(snapshot):
+            raise HTTPException(status_code=409, detail="この企業のジョブが実行中です")
 
         target_dir = company_dir(company)
         if os.path.isdir(target_dir):
             try:
-                shutil.rmtree(target_dir)
+                _remove_company_dir(company)
                 logger.info(f"Deleted results for company: {company}")
             except PermissionError as e:
                 logger.error(f"Permission denied when deleting {target_dir}: {e}")
@@ -525,7 +726,7 @@ def post_rerun(company: str, idx: int) -> Dict[str, Any]:
 
 def _monitor_process(job_id: str, company: str, proc: Any, thread: Optional[threading.Thread] = None) -> None:
     """Monitor a process or thread and clean up state when done."""
-    global running_process, running_company, running_job_id, running_thread
+    global run_state
     try:
         if thread is not None:
             # Thread-based execution
@@ -536,18 +737,13 @@ def _monitor_process(job_id: str, company: str, proc: Any, thread: Optional[thre
     finally:
         with state_lock:
             # Clear only if the same job is still recorded
-            if running_job_id == job_id:
-                running_process = None
-                running_thread = None
-                running_company = None
-                running_job_id = None
+            if run_state.job_id == job_id:
+                run_state = RunState()
 
 
 @app.post("/api/run", response_model=RunResponse)
 def post_run(req: RunRequest) -> RunResponse:
     """Start a background job to run Dify queries for a company."""
-    global running_process, running_company, running_job_id
-    
     try:
         company = req.company.strip()
         if not company:
@@ -558,18 +754,7 @@ def post_run(req: RunRequest) -> RunResponse:
         selected_set = set(selected)
         indices = [i + 1 for i, q in enumerate(QUERIES) if q in selected_set]
         if not indices:
-            indices = list(range(1, len(QUERIES) + 1))
-
-        # 全件存在している場合のみスキップ（結果返す）
-        def _all_exist(company_name: str) -> bool:
-            d = company_dir(company_name)
-            for i in range(1, len(QUERIES) + 1):
-                base = f"{company_name}_{i}"
-                txt_path = os.path.join(d, f"{base}.txt")
-                md_path = os.path.join(d, f"{base}.md")
-                if not (os.path.exists(txt_path) or os.path.exists(md_path)):
-                    return False
-            return True
+            indices = list(_INDEX_RANGE)
 
         # 競合実行の制御と起動前の存在チェック
         try:
@@ -579,23 +764,23 @@ def post_run(req: RunRequest) -> RunResponse:
             logger.error(f"Error creating directories for {company}: {e}")
             raise HTTPException(status_code=500, detail=f"ディレクトリの作成に失敗しました: {str(e)}")
 
-        if _all_exist(company):
+        # 既存ファイルは1回の scandir で取得し、以降は集合の参照のみ
+        existing = _company_files(company)
+
+        def _has_any(idx: int) -> bool:
+            txt_suf, md_suf = _SUFFIX_PAIRS[idx - 1]
+            return company + txt_suf in existing or company + md_suf in existing
+
+        # 全件存在している場合のみスキップ（結果返す）
+        if all(_has_any(i) for i in _INDEX_RANGE):
             return RunResponse(jobId="", company=company, status="completed")
 
         # 実行対象の最終決定：
         # - 明示的サブセット選択(queries が既定より少ない)なら選択通り実行（既存も上書き許容）
         # - 全件選択(queries が全件 or 未指定=フォールバック)の場合は、未完了のものだけ実行
-        def _has_any(company_name: str, idx: int) -> bool:
-            try:
-                d = company_dir(company_name)
-                base = f"{company_name}_{idx}"
-                return os.path.exists(os.path.join(d, f"{base}.txt")) or os.path.exists(os.path.join(d, f"{base}.md"))
-            except Exception:
-                return False
-
         is_full_selection = len(selected_set) >= len(QUERIES)
         if is_full_selection:
-            run_indices = [i for i in indices if not _has_any(company, i)]
+            run_indices = [i for i in indices if not _has_any(i)]
         else:
             run_indices = indices
 
@@ -613,22 +798,26 @@ def post_run(req: RunRequest) -> RunResponse:
 
 
 @app.get("/api/run/status")
-def get_run_status(company: Optional[str] = None) -> Dict[str, Any]:
+async def get_run_status(company: Optional[str] = None) -> Dict[str, Any]:
     """Get status of running jobs."""
+    return await anyio.to_thread.run_sync(_run_status, company)
+
+
+def _progress_only(company: str) -> Dict[str, int]:
+    """read_results' progress counts from the scandir signature alone, without opening any file."""
+    non_empty = {name for name, _, size in _results_signature(company) if size > 0}
+    completed = sum(
+        1 for suffixes in _RESULT_SUFFIXES if any(company + suffix in non_empty for suffix in suffixes[:4])
+    )
+    return {"completed": completed, "total": len(QUERIES)}
+
+
+def _run_status(company: Optional[str]) -> Dict[str, Any]:
     try:
-        with state_lock:
-            if running_process is not None:
-                try:
-                    poll_result = running_process.poll()
-                    alive = poll_result is None
-                except Exception as e:
-                    logger.warning(f"Error checking process status in get_run_status: {e}")
-                    alive = False
-            else:
-                alive = False
-            is_target = company is None or running_company == company
-            mem_running = alive and is_target
-            job_id = running_job_id if mem_running else None
+        snapshot = run_state
+        is_target = company is None or snapshot.company == company
+        mem_running = is_target and _alive(snapshot)
+        job_id = snapshot.job_id if mem_running else None
         
         disk_running = False
         if company:
@@ -650,12 +839,11 @@ def get_run_status(company: Optional[str] = None) -> Dict[str, Any]:
         progress = None
         if company:
             try:
-                res = read_results(company)
-                progress = res.get("progress")
+                progress = _progress_only(company)
             except Exception as e:
                 logger.warning(f"Error getting progress for {company}: {e}")
 
-        return {"status": status, "company": running_company if mem_running else company, "jobId": job_id, "progress": progress}
+        return {"status": status, "company": snapshot.company if mem_running else company, "jobId": job_id, "progress": progress}
     except Exception as e:
         logger.error(f"Unexpected error in get_run_status: {str(e)}", exc_info=True)
         # Return safe default instead of raising exception
@@ -664,20 +852,10 @@ def get_run_status(company: Optional[str] = None) -> Dict[str, Any]:
 
 def _begin_background_job(company: str, run_indices: List[int]) -> str:
     """Start background job for specified indices with locking."""
-    global running_process, running_company, running_job_id, running_thread
+    global run_state
 
     with state_lock:
-        if running_process is not None:
-            try:
-                poll_result = running_process.poll()
-                alive = poll_result is None
-            except Exception as e:
-                logger.warning(f"Error checking process status in _begin_background_job: {e}")
-                alive = False
-        else:
-            alive = False
-
-        if alive:
+        if _alive(run_state):
             raise HTTPException(status_code=409, detail="別のジョブが実行中です")
 
         job_id = str(uuid.uuid4())
@@ -694,34 +872,18 @@ def _begin_background_job(company: str, run_indices: List[int]) -> str:
                 except Exception:
                     pass
 
-        running_company = company
-        running_job_id = job_id
-
         try:
             t = threading.Thread(target=_run_job, daemon=True)
             t.start()
         except Exception as e:
             logger.error(f"Failed to start background thread for {company}: {e}", exc_info=True)
-            running_company = None
-            running_job_id = None
             raise HTTPException(status_code=500, detail="バックグラウンドジョブの開始に失敗しました")
 
-        # Create a dummy process object for compatibility with existing monitoring code
-        class DummyProcess:
-            def __init__(self, thread: threading.Thread):
-                self.thread = thread
-
-            def poll(self):
-                try:
-                    return 0 if not self.thread.is_alive() else None
-                except Exception:
-                    return 0
-
-        running_process = DummyProcess(t)
-        running_thread = t
+        proc = DummyProcess(t)
+        run_state = RunState(job_id=job_id, company=company, process=proc, thread=t)
 
         try:
-            monitor_thread = threading.Thread(target=_monitor_process, args=(job_id, company, running_process, t), daemon=True)
+            monitor_thread = threading.Thread(target=_monitor_process, args=(job_id, company, proc, t), daemon=True)
             monitor_thread.start()
         except Exception as e:
             logger.warning(f"Failed to start monitor thread for {company}: {e}")
@@ -731,8 +893,12 @@ def _begin_background_job(company: str, run_indices: List[int]) -> str:
 
 
 @app.get("/api/proposal/{company}/progress")
-def get_proposal_progress(company: str) -> Dict[str, Any]:
+async def get_proposal_progress(company: str) -> Dict[str, Any]:
     """Get progress of proposal creation."""
+    return await anyio.to_thread.run_sync(_proposal_progress, company)
+
+
+def _proposal_progress(company: str) -> Dict[str, Any]:
     try:
         dir_path = company_dir(company)
         if not os.path.isdir(dir_path):
@@ -753,13 +919,13 @@ def get_proposal_progress(company: str) -> Dict[str, Any]:
         
         if os.path.exists(progress_file):
             try:
-                with open(progress_file, "r", encoding="utf-8") as f:
-                    progress_data = json.load(f)
+                with open(progress_file, "rb") as f:
+                    progress_data = orjson.loads(f.read())
                     # Ensure status is set
                     if "status" not in progress_data:
                         progress_data["status"] = "processing"
                     return progress_data
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 logger.warning(f"Invalid JSON in progress file {progress_file}: {e}")
             except Exception as e:
                 logger.warning(f"Error reading progress file {progress_file}: {e}")
@@ -771,92 +937,440 @@ def get_proposal_progress(company: str) -> Dict[str, Any]:
         return {"current": 0, "total": 0, "status": "error"}
 
 
+def _collect_research_files(company: str) -> List[Tuple[int, str]]:
+    """Collect research file contents (1-5), preferring edited versions."""
+    research_files = []
+    for i in _INDEX_RANGE:
+        paths = _result_paths(company, i)
+        # prefer edited
+        candidates = [paths["edited_txt"], paths["txt"]]
+        for path in candidates:
+            try:
+                # One open + fstat + read of the whole file instead of buffered text IO
+                text = _read_text_or_none(path)
+            except Exception as e:
+                logger.warning(f"Failed to read file {path}: {e}")
+                continue
+            if text is None:
+                continue
+            content = text.strip()
+            if content:
+                research_files.append((i, content))
+                logger.debug(f"Read file {i}: {path}, size: {len(content)} chars")
+                break
+    return research_files
+
+
+def _backoff(prev: float, base: float, cap: float = DIFY_RETRY_BACKOFF_CAP_SECONDS) -> float:
+    """Decorrelated-jitter backoff: the next wait is drawn from [base, 3 * prev], capped.
+
+    Spreads out retries from concurrent callers instead of having them hit Dify in lockstep.
+    """
+    return min(cap, random.uniform(base, max(base, prev) * 3))
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date); None if absent/invalid."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Shared across retries and proposal calls so TCP/TLS connections to Dify are reused
+_dify_client: Optional[httpx.AsyncClient] = None
+
+
+def _dify_async_client() -> httpx.AsyncClient:
+    """Return the pooled Dify workflow client, creating it on first use inside the event loop."""
+    global _dify_client
+    if _dify_client is None or _dify_client.is_closed:
+        _dify_client = httpx.AsyncClient(
+            timeout=DIFY_TIMEOUT,
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+        )
+    return _dify_client
+
+
+async def _close_dify_client() -> None:
+    global _dify_client
+    if _dify_client is not None:
+        await _dify_client.aclose()
+        _dify_client = None
+
+
+def _tmp_path_for(path: str) -> str:
+    """Temp file name unique to each call.
+
+    Proposal files finish concurrently, so two writers may replace the same
+    target at once; a shared ``.tmp`` name would let one rename the other's file.
+    Concurrent requests share the event-loop thread, so pid/thread alone are not
+    enough and a random token is added.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.{uuid.uuid4().hex[:8]}.tmp"
+
+
+def _atomic_write_json(path: str, payload: Any, final: bool = False) -> None:
+    """Write JSON to a temp file and rename it over ``path`` so readers never see a partial file.
+
+    fsync is only paid for final states.
+    """
+    tmp_path = _tmp_path_for(path)
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        os.write(fd, orjson.dumps(payload))
+        if final:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+
+
+async def _update_progress(path: str, payload: Any, final: bool = False) -> None:
+    """_atomic_write_json on a worker thread so the event loop keeps serving polls."""
+    await anyio.to_thread.run_sync(_atomic_write_json, path, payload, final)
+
+
+def _remove_if_exists(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _proposal_cache_path(research_content_cleaned: str) -> str:
+    key = hashlib.sha256(research_content_cleaned.encode("utf-8")).hexdigest()
+    return os.path.join(PROPOSAL_CACHE_DIR, key + ".txt")
+
+
+def _read_cached_part(path: str) -> Optional[str]:
+    """Cached workflow output for a research text; None on miss, empty or expired entry."""
+    try:
+        if PROPOSAL_CACHE_TTL_SECONDS > 0 and time.time() - os.path.getmtime(path) > PROPOSAL_CACHE_TTL_SECONDS:
+            return None
+        text = _read_text_or_none(path)
+    except FileNotFoundError:
+        return None
+    return text if text and text.strip() else None
+
+
+def _write_cached_part(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = _tmp_path_for(path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class _ProposalWriter:
+    """Appends finished file parts to a temp file in research order.
+
+    Parts may finish out of order; each one is written as soon as all earlier
+    positions are known, so only out-of-order parts are held in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0  # parts written
+        self.length = 0  # chars written, separators included
+        self._f = open(path, "w", encoding="utf-8")
+        self._pending: Dict[int, Optional[str]] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def add(self, pos: int, part: Optional[str]) -> None:
+        """Record the result for ``pos`` (None if the file produced nothing)."""
+        with self._lock:
+            self._pending[pos] = part
+            while self._next in self._pending:
+                ready = self._pending.pop(self._next)
+                self._next += 1
+                if ready:
+                    if self.count:
+                        self._f.write("\n\n")
+                        self.length += 2
+                    self._f.write(ready)
+                    self.length += len(ready)
+                    self.count += 1
+
+    def commit(self, final_path: str) -> None:
+        """Flush and rename over ``final_path``; readers never see a partial proposal."""
+        self._f.close()
+        os.replace(self.path, final_path)
+
+    def discard(self) -> None:
+        with self._lock:
+            self._f.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _proposal_save_error(path: str, e: Exception) -> HTTPException:
+    if isinstance(e, PermissionError):
+        logger.error(f"Permission denied when saving proposal to {path}: {e}")
+        return HTTPException(status_code=500, detail="提案ファイルの保存に失敗しました（権限エラー）")
+    if isinstance(e, OSError):
+        logger.error(f"OS error when saving proposal to {path}: {e}")
+        return HTTPException(status_code=500, detail=f"提案ファイルの保存に失敗しました: {str(e)}")
+    logger.error(f"Unexpected error saving proposal to {path}: {e}", exc_info=True)
+    return HTTPException(status_code=500, detail=f"提案ファイルの保存中にエラーが発生しました: {str(e)}")
+
+
+def _proposal_target_dir(company: str) -> str:
+    """Validate proposal preconditions and return the company directory."""
+    if not DIFY_API_KEY2:
+        logger.error("DIFY_API_KEY2 is not configured")
+        raise HTTPException(status_code=500, detail="DIFY_API_KEY2 is not configured")
+
+    dir_path = company_dir(company)
+    if not os.path.isdir(dir_path):
+        raise HTTPException(status_code=404, detail=f"Company '{company}' not found")
+    return dir_path
+
+
 @app.post("/api/proposal/{company}")
-def create_proposal(company: str) -> Dict[str, Any]:
-    """Create a proposal by processing each .txt file sequentially and calling Dify workflow API."""
+async def create_proposal(company: str, stream: bool = False) -> Any:
+    """Create a proposal by sending each .txt file to the Dify workflow API (concurrently, up to PROPOSAL_CONCURRENCY).
+
+    With ``?stream=true`` the generated text is forwarded as server-sent events while
+    it is produced; otherwise the full proposal is returned as JSON once complete.
+    """
+    if not stream:
+        return {"proposal": await _generate_proposal(company)}
+
+    logger.info(f"Streaming proposal request received for company: {company}")
+    # Validate before the response starts so errors keep their status code
+    _proposal_target_dir(company)
+    return StreamingResponse(_proposal_stream(company), media_type="text/event-stream")
+
+
+_JSON_OPENERS = (b"{", b"[")
+# Raw-byte markers of skippable events, in both compact and json.dumps spacing
+_SKIP_MARKERS: Tuple[bytes, ...] = tuple(
+    f'"event"{sep}"{name}"'.encode("utf-8") for name in DIFY_SSE_SKIP_EVENTS for sep in (":", ": ")
+)
+
+
+def _is_skipped_event(data: bytes) -> bool:
+    """True if ``data`` is a skippable event; a substring test is far cheaper than a parse."""
+    return any(m in data for m in _SKIP_MARKERS)
+
+
+def _drain_sse_data(buf: bytearray) -> List[bytes]:
+    """Consume the complete lines in ``buf`` and return the payloads of its ``data:`` lines.
+
+    Framing happens on raw bytes, so only the JSON payloads are ever decoded;
+    an incomplete trailing line stays in ``buf`` for the next chunk. Payloads that
+    cannot carry an event (empty, ``{}``, not an object/array) are dropped here,
+    before anyone pays for a JSON parse; ``[DONE]`` still passes through.
+    """
+    payloads = []
+    start = 0
+    while (nl := buf.find(b"\n", start)) >= 0:
+        if buf.startswith(b"data:", start, nl):
+            payload = bytes(buf[start + 5:nl]).strip()
+            if payload[:1] in _JSON_OPENERS and payload != b"{}":
+                payloads.append(payload)
+        start = nl + 1
+    if start:
+        del buf[:start]
+    return payloads
+
+
+def _iter_sse_data(r: httpx.Response, chunk_size: int = 16384) -> Iterator[bytes]:
+    """Yield the payload of each SSE ``data:`` line of a streaming httpx response."""
+    buf = bytearray()
+    for chunk in r.iter_bytes(chunk_size=chunk_size):
+        buf += chunk
+        yield from _drain_sse_data(buf)
+    buf += b"\n"
+    yield from _drain_sse_data(buf)
+
+
+# Fields that carry streamed text in workflow events, in priority order
+_TEXT_KEYS: Tuple[str, ...] = ("answer", "text", "output")
+# Preferred fields of workflow_finished outputs
+_OUTPUT_KEYS: Tuple[str, ...] = ("text", "answer", "output", "result")
+
+
+def _first_text(obj: Dict[str, Any], keys: Tuple[str, ...] = _TEXT_KEYS) -> Optional[str]:
+    """First non-empty string among ``keys`` of ``obj`` (one dict lookup per key)."""
+    for key in keys:
+        value = obj.get(key)
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
+def _workflow_finished_text(evt: Dict[str, Any]) -> Optional[str]:
+    """Final output: a preferred outputs field, else the first non-blank string value."""
+    data_obj = evt.get("data")
+    if not isinstance(data_obj, dict):
+        return None
+    outputs = data_obj.get("outputs")
+    if not isinstance(outputs, dict):
+        return None
+    for key in _OUTPUT_KEYS:
+        value = outputs.get(key)
+        if isinstance(value, str) and value.strip():
+            return value
+    for value in outputs.values():
+        if isinstance(value, str) and value.strip():
+            return value
+    return None
+
+
+def _text_chunk_text(evt: Dict[str, Any]) -> Optional[str]:
+    text = evt.get("text")
+    return text if isinstance(text, str) and text else None
+
+
+def _generic_event_text(evt: Dict[str, Any]) -> Optional[str]:
+    """Streamed text of any other event, at the top level or under ``data``."""
+    value = _first_text(evt)
+    if value is None and isinstance(data_obj := evt.get("data"), dict):
+        value = _first_text(data_obj)
+    return value
+
+
+# Text extractor per workflow event type; one dict lookup per frame instead of an elif chain
+_EVENT_TEXT: Dict[str, Callable[[Dict[str, Any]], Optional[str]]] = {
+    "workflow_finished": _workflow_finished_text,
+    "text_chunk": _text_chunk_text,
+}
+
+
+async def _aiter_sse_data(r: httpx.Response) -> AsyncIterator[bytes]:
+    """Yield the payload of each SSE ``data:`` line of a streaming httpx response."""
+    buf = bytearray()
+    async for chunk in r.aiter_bytes():
+        buf += chunk
+        for data in _drain_sse_data(buf):
+            yield data
+    buf += b"\n"
+    for data in _drain_sse_data(buf):
+        yield data
+
+
+def _sse_frame(evt: Dict[str, Any]) -> bytes:
+    return b"data: " + orjson.dumps(evt) + b"\n\n"
+
+
+async def _proposal_stream(company: str) -> AsyncIterator[bytes]:
+    """Run _generate_proposal and forward its events to the client as SSE frames."""
+    queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+    listening = True
+
+    def notify(evt: Optional[Dict[str, Any]]) -> None:
+        # Once the client is gone nothing reads the queue, so events are dropped
+        if listening:
+            queue.put_nowait(evt)
+
+    task = asyncio.create_task(_generate_proposal(company, notify=notify))
+    # Keep a reference so generation finishes (and is saved) even if the client disconnects
+    _proposal_tasks.add(task)
+    task.add_done_callback(_proposal_tasks.discard)
+    task.add_done_callback(lambda _: notify(None))
+
+    try:
+        while True:
+            evt = await queue.get()
+            if evt is None:
+                break
+            yield _sse_frame(evt)
+
+        try:
+            proposal_text = task.result()
+        except HTTPException as e:
+            yield _sse_frame({"event": "error", "status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Unexpected error streaming proposal for {company}: {str(e)}", exc_info=True)
+            yield _sse_frame({"event": "error", "status": 500, "detail": "提案作成中に予期しないエラーが発生しました"})
+        else:
+            yield _sse_frame({"event": "done", "length": len(proposal_text)})
+    finally:
+        # Client disconnected (or the stream ended): detach the notifier and free what is queued
+        listening = False
+        while not queue.empty():
+            queue.get_nowait()
+
+
+async def _generate_proposal(
+    company: str, notify: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> str:
+    """Generate (or load the saved) proposal text.
+
+    ``notify`` receives progress/chunk/reset events as they happen; it is used to
+    tee the Dify stream to a streaming client.
+    """
     try:
         logger.info(f"Proposal creation request received for company: {company}")
         
-        if not DIFY_API_KEY2:
-            logger.error("DIFY_API_KEY2 is not configured")
-            raise HTTPException(status_code=500, detail="DIFY_API_KEY2 is not configured")
-
         # Check if proposal already exists
-        dir_path = company_dir(company)
-        if not os.path.isdir(dir_path):
-            raise HTTPException(status_code=404, detail=f"Company '{company}' not found")
+        dir_path = _proposal_target_dir(company)
         
         proposal_txt_path = os.path.join(dir_path, f"{company}_proposal.txt")
         proposal_md_path = os.path.join(dir_path, f"{company}_proposal.md")
         progress_file = os.path.join(dir_path, f"{company}_proposal_progress.json")
         
         # If proposal already exists, return it
-        if os.path.exists(proposal_txt_path):
-            try:
-                with open(proposal_txt_path, "r", encoding="utf-8") as f:
-                    existing_proposal = f.read().strip()
-                if existing_proposal:
-                    logger.info(f"Returning cached proposal for {company}")
-                    # Clean up progress file if exists
-                    try:
-                        if os.path.exists(progress_file):
-                            os.remove(progress_file)
-                    except Exception:
-                        pass
-                    return {"proposal": existing_proposal}
-            except Exception as e:
-                logger.warning(f"Failed to read cached proposal: {e}")
-
-        # Collect all .txt file contents (1-5)
-        research_files = []
-        for i in range(1, len(QUERIES) + 1):
-            paths = _result_paths(company, i)
-            # prefer edited
-            candidates = [paths["edited_txt"], paths["txt"]]
-            for path in candidates:
-                if os.path.exists(path):
-                    try:
-                        with open(path, "r", encoding="utf-8") as f:
-                            content = f.read().strip()
-                            if content:
-                                research_files.append((i, content))
-                                logger.debug(f"Read file {i}: {path}, size: {len(content)} chars")
-                                break
-                    except Exception as e:
-                        logger.warning(f"Failed to read file {path}: {e}")
+        try:
+            existing_proposal = await anyio.to_thread.run_sync(_read_text_or_none, proposal_txt_path)
+            existing_proposal = (existing_proposal or "").strip()
+            if existing_proposal:
+                logger.info(f"Returning cached proposal for {company}")
+                # Clean up progress file if exists
+                try:
+                    if os.path.exists(progress_file):
+                        os.remove(progress_file)
+                except Exception:
+                    pass
+                if notify is not None:
+                    notify({"event": "chunk", "index": 0, "text": existing_proposal})
+                return existing_proposal
+        except Exception as e:
+            logger.warning(f"Failed to read cached proposal: {e}")
+
+        research_files = await anyio.to_thread.run_sync(_collect_research_files, company)
 
         if not research_files:
             raise HTTPException(status_code=400, detail=f"No research data found for company '{company}'")
 
-        # Process each file sequentially
-        headers = {
-            "Authorization": f"Bearer {DIFY_API_KEY2}",
-            "Content-Type": "application/json",
-        }
-        
-        all_proposal_parts = []
         total_files = len(research_files)
         
         # Initialize progress file
         try:
-            with open(progress_file, "w", encoding="utf-8") as f:
-                json.dump({"current": 0, "total": total_files, "status": "processing"}, f)
+            await _update_progress(progress_file, {"current": 0, "total": total_files, "status": "processing"})
         except Exception as e:
             logger.warning(f"Failed to create progress file: {e}")
+        last_progress_write = time.monotonic()
 
-        for file_idx, (query_idx, research_content) in enumerate(research_files, 1):
+        async def _process_file(file_idx: int, query_idx: int, research_content: str) -> Optional[str]:
+            """Run one research file through the workflow; None if it produced nothing."""
             logger.info(f"Processing file {query_idx}/{len(research_files)} for {company}")
-            
-            # Update progress
-            try:
-                with open(progress_file, "w", encoding="utf-8") as f:
-                    json.dump({"current": file_idx, "total": total_files, "status": "processing"}, f)
-            except Exception:
-                pass
-            
+
             # Remove URLs from content
             research_content_cleaned = remove_urls_from_text(research_content)
             logger.info(f"File {query_idx}: Original length: {len(research_content)}, After URL removal: {len(research_content_cleaned)} chars")
+
+            # Identical research text has already been through the workflow: reuse its output
+            cache_path = _proposal_cache_path(research_content_cleaned) if PROPOSAL_CACHE_ENABLED else None
+            if cache_path is not None:
+                try:
+                    cached_part = await anyio.to_thread.run_sync(_read_cached_part, cache_path)
+                except Exception as e:
+                    logger.warning(f"Failed to read proposal cache {cache_path}: {e}")
+                    cached_part = None
+                if cached_part is not None:
+                    if notify is not None:
+                        notify({"event": "chunk", "index": query_idx, "text": cached_part})
+                    logger.info(f"File {query_idx} served from proposal cache. Proposal length: {len(cached_part)} chars")
+                    return cached_part
             
             # Call Dify Workflow API for this file
             payload = {
@@ -865,60 +1379,75 @@ def create_proposal(company: str) -> Dict[str, Any]:
                 "user": DIFY_USER_ID,
             }
             
-            proposal_parts = []
+            # Streamed deltas are appended as UTF-8 bytes and decoded once at the end,
+            # instead of keeping thousands of tiny str objects alive in a list
+            proposal_buf = bytearray()
             max_retries = 3
-            retry_delay = 5  # seconds
+            retry_delay = 5  # seconds, lower bound of the jittered backoff
+            prev_wait = float(retry_delay)
+
+            def _add_part(value: str) -> None:
+                proposal_buf.extend(value.encode("utf-8"))
+                if notify is not None:
+                    notify({"event": "chunk", "index": query_idx, "text": value})
+
+            def _reset_parts() -> None:
+                proposal_buf.clear()
+                if notify is not None:
+                    notify({"event": "reset", "index": query_idx})
             
             for attempt in range(1, max_retries + 1):
+                # Drop partial output from a previous attempt so retries don't duplicate text
+                if proposal_buf:
+                    _reset_parts()
                 try:
                     logger.info(f"Sending request {file_idx}/{len(research_files)} to Dify Workflow API (attempt {attempt}/{max_retries})")
                     try:
-                        with requests.post(
-                            DIFY_WORKFLOW_ENDPOINT, headers=headers, json=payload, stream=True, timeout=DIFY_TIMEOUT
+                        async with _dify_async_client().stream(
+                            "POST", DIFY_WORKFLOW_ENDPOINT, headers=DIFY_WORKFLOW_HEADERS, json=payload
                         ) as r:
                             logger.info(f"Dify API response status for file {query_idx}: {r.status_code}")
                             
                             # Handle non-200 status codes
                             if r.status_code == 429:  # Rate limit
                                 if attempt < max_retries:
-                                    wait_time = retry_delay * attempt
-                                    logger.warning(f"Rate limited, waiting {wait_time}s before retry {attempt + 1}/{max_retries}")
-                                    time.sleep(wait_time)
+                                    wait_time = _retry_after_seconds(r.headers.get("Retry-After"))
+                                    if wait_time is None:
+                                        wait_time = prev_wait = _backoff(prev_wait, retry_delay)
+                                    logger.warning(f"Rate limited, waiting {wait_time:.1f}s before retry {attempt + 1}/{max_retries}")
+                                    await asyncio.sleep(wait_time)
                                     continue
                                 else:
-                                    error_text = r.text[:500] if r.text else "Rate limit exceeded"
                                     logger.error(f"Dify API rate limit error for file {query_idx}")
                                     raise HTTPException(status_code=429, detail=f"リクエスト制限に達しました。しばらく待ってから再試行してください。")
                             
                             if r.status_code in (500, 502, 503, 504):  # Server errors - retry
                                 if attempt < max_retries:
-                                    wait_time = retry_delay * attempt
-                                    logger.warning(f"Server error {r.status_code}, waiting {wait_time}s before retry {attempt + 1}/{max_retries}")
-                                    time.sleep(wait_time)
+                                    wait_time = prev_wait = _backoff(prev_wait, retry_delay)
+                                    logger.warning(f"Server error {r.status_code}, waiting {wait_time:.1f}s before retry {attempt + 1}/{max_retries}")
+                                    await asyncio.sleep(wait_time)
                                     continue
                                 else:
-                                    error_text = r.text[:500] if r.text else "Server error"
+                                    error_text = (await r.aread()).decode("utf-8", errors="replace")[:500] or "Server error"
                                     logger.error(f"Dify API server error for file {query_idx}: {r.status_code} - {error_text}")
                                     raise HTTPException(status_code=500, detail=f"Dify APIサーバーエラー ({r.status_code})。しばらく待ってから再試行してください。")
                             
                             if r.status_code != 200:
-                                error_text = r.text[:500] if r.text else "No error message"
+                                error_text = (await r.aread()).decode("utf-8", errors="replace")[:500] or "No error message"
                                 logger.error(f"Dify API error for file {query_idx}: {r.status_code} - {error_text}")
                                 raise HTTPException(status_code=500, detail=f"Dify API error ({r.status_code}) for file {query_idx}: {error_text}")
 
                             # Process streaming response
-                            for raw in r.iter_lines(decode_unicode=True):
-                                if not raw:
-                                    continue
-                                if not raw.startswith("data:"):
-                                    continue
-                                data = raw[5:].strip()
-                                if data == "[DONE]":
+                            workflow_error: Optional[str] = None
+                            async for data in _aiter_sse_data(r):
+                                if data == b"[DONE]":
                                     break
+                                if _is_skipped_event(data):
+                                    continue
                                 try:
-                                    evt = json.loads(data)
-                                except json.JSONDecodeError:
-                                    logger.debug(f"Failed to parse JSON from stream: {data[:100]}")
+                                    evt = orjson.loads(data)
+                                except orjson.JSONDecodeError:
+                                    logger.debug(f"Failed to parse JSON from stream: {data[:100]!r}")
                                     continue
                                 except Exception as e:
                                     logger.debug(f"Error parsing stream data: {e}")
@@ -926,80 +1455,46 @@ def create_proposal(company: str) -> Dict[str, Any]:
 
                                 if isinstance(evt, dict):
                                     event_type = evt.get("event")
-                                    
-                                    # Handle workflow_finished event (final output)
-                                    if event_type == "workflow_finished":
-                                        data_obj = evt.get("data")
-                                        if isinstance(data_obj, dict):
-                                            outputs = data_obj.get("outputs")
-                                            if isinstance(outputs, dict):
-                                                # Prefer text-like fields from outputs
-                                                for key in ("text", "answer", "output", "result"):
-                                                    value = outputs.get(key)
-                                                    if isinstance(value, str) and value.strip():
-                                                        proposal_parts.append(value)
-                                                        break
-                                                # If no standard field found, use first string value
-                                                if not any(isinstance(outputs.get(k), str) and outputs.get(k).strip() for k in ("text", "answer", "output", "result")):
-                                                    for value in outputs.values():
-                                                        if isinstance(value, str) and value.strip():
-                                                            proposal_parts.append(value)
-                                                            break
-                                    
-                                    # Handle text_chunk events (streaming chunks during execution)
-                                    elif event_type == "text_chunk":
-                                        text = evt.get("text")
-                                        if isinstance(text, str) and text:
-                                            proposal_parts.append(text)
-                                    
-                                    # Handle streaming answer during execution
-                                    elif "answer" in evt:
-                                        proposal_parts.append(evt["answer"])
-                                    elif "text" in evt:
-                                        proposal_parts.append(evt["text"])
-                                    elif "output" in evt:
-                                        proposal_parts.append(evt["output"])
-                                    elif "data" in evt and isinstance(evt["data"], dict):
-                                        if "answer" in evt["data"]:
-                                            proposal_parts.append(evt["data"]["answer"])
-                                        elif "text" in evt["data"]:
-                                            proposal_parts.append(evt["data"]["text"])
-                                        elif "output" in evt["data"]:
-                                            proposal_parts.append(evt["data"]["output"])
-                                    
-                                    # Handle errors
-                                    elif event_type == "error" and evt.get("message"):
-                                        error_msg = evt.get("message", "Unknown error")
-                                        logger.error(f"Dify workflow error event for file {query_idx}: {error_msg}")
-                                        if attempt < max_retries:
-                                            wait_time = retry_delay * attempt
-                                            logger.warning(f"Workflow error, waiting {wait_time}s before retry {attempt + 1}/{max_retries}")
-                                            time.sleep(wait_time)
-                                            proposal_parts = []  # Reset for retry
-                                            break  # Break from inner loop to retry
-                                        else:
-                                            raise HTTPException(status_code=500, detail=f"Dify workflow error for file {query_idx}: {error_msg}")
-                            
-                            # If we got here, the request was successful
-                            break
+                                    if event_type == "error":
+                                        if evt.get("message"):
+                                            workflow_error = evt["message"]
+                                            break
+                                        continue
+                                    value = _EVENT_TEXT.get(event_type, _generic_event_text)(evt)
+                                    if value is not None:
+                                        _add_part(value)
+
+                            # If we got here without an error event, the request was successful
+                            if workflow_error is None:
+                                break
+
+                        # Workflow error event (the stream is already closed while waiting)
+                        logger.error(f"Dify workflow error event for file {query_idx}: {workflow_error}")
+                        if attempt < max_retries:
+                            wait_time = prev_wait = _backoff(prev_wait, retry_delay)
+                            logger.warning(f"Workflow error, waiting {wait_time:.1f}s before retry {attempt + 1}/{max_retries}")
+                            await asyncio.sleep(wait_time)
+                            _reset_parts()  # Reset for retry
+                            continue
+                        raise HTTPException(status_code=500, detail=f"Dify workflow error for file {query_idx}: {workflow_error}")
                         
-                    except Timeout as e:
+                    except httpx.TimeoutException as e:
                         logger.warning(f"Timeout when calling Dify workflow API for file {query_idx} (attempt {attempt}/{max_retries}): {str(e)}")
                         if attempt < max_retries:
-                            wait_time = retry_delay * attempt
-                            logger.info(f"Retrying after {wait_time}s...")
-                            time.sleep(wait_time)
+                            wait_time = prev_wait = _backoff(prev_wait, retry_delay)
+                            logger.info(f"Retrying after {wait_time:.1f}s...")
+                            await asyncio.sleep(wait_time)
                             continue
                         else:
                             logger.error(f"Timeout after {max_retries} attempts for file {query_idx}")
                             raise HTTPException(status_code=504, detail=f"Dify APIへのリクエストがタイムアウトしました (ファイル{query_idx})。時間がかかりすぎています。")
                     
-                    except RequestsConnectionError as e:
+                    except httpx.NetworkError as e:
                         logger.warning(f"Connection error when calling Dify workflow API for file {query_idx} (attempt {attempt}/{max_retries}): {str(e)}")
                         if attempt < max_retries:
-                            wait_time = retry_delay * attempt
-                            logger.info(f"Retrying after {wait_time}s...")
-                            time.sleep(wait_time)
+                            wait_time = prev_wait = _backoff(prev_wait, retry_delay)
+                            logger.info(f"Retrying after {wait_time:.1f}s...")
+                            await asyncio.sleep(wait_time)
                             continue
                         else:
                             logger.error(f"Connection error after {max_retries} attempts for file {query_idx}")
@@ -1007,12 +1502,12 @@ def create_proposal(company: str) -> Dict[str, Any]:
                     
                 except HTTPException:
                     raise  # Re-raise HTTP exceptions immediately
-                except RequestException as e:
+                except httpx.HTTPError as e:
                     logger.warning(f"Request exception when calling Dify workflow API for file {query_idx} (attempt {attempt}/{max_retries}): {str(e)}")
                     if attempt < max_retries:
-                        wait_time = retry_delay * attempt
-                        logger.info(f"Retrying after {wait_time}s...")
-                        time.sleep(wait_time)
+                        wait_time = prev_wait = _backoff(prev_wait, retry_delay)
+                        logger.info(f"Retrying after {wait_time:.1f}s...")
+                        await asyncio.sleep(wait_time)
                         continue
                     else:
                         logger.error(f"Request exception after {max_retries} attempts for file {query_idx}: {str(e)}")
@@ -1020,58 +1515,105 @@ def create_proposal(company: str) -> Dict[str, Any]:
                 except Exception as e:
                     logger.error(f"Unexpected error in proposal creation for file {query_idx} (attempt {attempt}/{max_retries}): {str(e)}", exc_info=True)
                     if attempt < max_retries:
-                        wait_time = retry_delay * attempt
-                        logger.info(f"Retrying after {wait_time}s...")
-                        time.sleep(wait_time)
+                        wait_time = prev_wait = _backoff(prev_wait, retry_delay)
+                        logger.info(f"Retrying after {wait_time:.1f}s...")
+                        await asyncio.sleep(wait_time)
                         continue
                     else:
                         raise HTTPException(status_code=500, detail=f"予期しないエラーが発生しました (ファイル{query_idx}): {str(e)}")
         
             # If we exhausted all retries without success
-            if not proposal_parts:
+            if not proposal_buf:
                 logger.error(f"Failed to get proposal parts for file {query_idx} after {max_retries} attempts")
-                # Continue to next file instead of failing completely
+                # Continue with the other files instead of failing completely
                 logger.warning(f"Skipping file {query_idx} and continuing with remaining files")
-            else:
-                file_proposal = "".join(proposal_parts)
-                if file_proposal.strip():
-                    all_proposal_parts.append(file_proposal)
-                    logger.info(f"File {query_idx} processed successfully. Proposal length: {len(file_proposal)} chars")
-                else:
-                    logger.warning(f"File {query_idx} returned empty proposal")
+                return None
+            file_proposal = proposal_buf.decode("utf-8")
+            if not file_proposal.strip():
+                logger.warning(f"File {query_idx} returned empty proposal")
+                return None
+            logger.info(f"File {query_idx} processed successfully. Proposal length: {len(file_proposal)} chars")
+            if cache_path is not None:
+                try:
+                    await anyio.to_thread.run_sync(_write_cached_part, cache_path, file_proposal)
+                except Exception as e:
+                    logger.warning(f"Failed to write proposal cache {cache_path}: {e}")
+            return file_proposal
+
+        # Finished parts go straight to a temp file (renamed into place at the end)
+        # instead of being kept in a list and joined in memory. The name is unique per
+        # request, so concurrent proposals for one company never share or delete it.
+        part_path = _tmp_path_for(proposal_txt_path)
+        try:
+            writer = await anyio.to_thread.run_sync(_ProposalWriter, part_path)
+        except Exception as e:
+            raise _proposal_save_error(part_path, e)
 
-        # Combine all proposal parts
-        proposal_text = "\n\n".join(all_proposal_parts)
-        logger.info(f"Proposal creation completed. Total files processed: {len(all_proposal_parts)}/{total_files}, Total length: {len(proposal_text)} chars")
+        # Files are independent, so up to PROPOSAL_CONCURRENCY workflow calls run at once
+        semaphore = asyncio.Semaphore(PROPOSAL_CONCURRENCY)
+        completed = 0
 
-        if not proposal_text.strip():
+        async def _run_file(file_idx: int, query_idx: int, research_content: str) -> None:
+            nonlocal completed, last_progress_write
+            async with semaphore:
+                part = await _process_file(file_idx, query_idx, research_content)
+            try:
+                await anyio.to_thread.run_sync(writer.add, file_idx - 1, part)
+            except Exception as e:
+                raise _proposal_save_error(part_path, e)
+            completed += 1
+            # Progress counts finished files (throttled, but the last one is always recorded)
+            now = time.monotonic()
+            if completed == total_files or now - last_progress_write >= PROGRESS_WRITE_INTERVAL_SECONDS:
+                try:
+                    await _update_progress(progress_file, {"current": completed, "total": total_files, "status": "processing"})
+                    last_progress_write = now
+                except Exception:
+                    pass
+            if notify is not None:
+                notify({"event": "progress", "current": completed, "total": total_files})
+
+        tasks = [
+            asyncio.ensure_future(_run_file(file_idx, query_idx, research_content))
+            for file_idx, (query_idx, research_content) in enumerate(research_files, 1)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One file failed hard (or the caller was cancelled): stop the others
+            for task in tasks:
+                task.cancel()
+            # Wait until they are done (a thread already inside writer.add finishes before
+            # its task does) so nothing writes after discard; this also retrieves their errors
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.discard()
+            raise
+        logger.info(f"Proposal creation completed. Total files processed: {writer.count}/{total_files}, Total length: {writer.length} chars")
+
+        if not writer.count:
+            writer.discard()
             logger.error("Empty response from all Dify workflow API calls")
             # Update progress to show error
             try:
-                with open(progress_file, "w", encoding="utf-8") as f:
-                    json.dump({"current": total_files, "total": total_files, "status": "error", "message": "すべてのファイル処理が失敗しました"}, f)
+                await _update_progress(
+                    progress_file,
+                    {"current": total_files, "total": total_files, "status": "error", "message": "すべてのファイル処理が失敗しました"},
+                    final=True,
+                )
             except Exception:
                 pass
             raise HTTPException(status_code=500, detail="DifyワークフローAPIから空のレスポンスが返されました。すべてのファイル処理に失敗した可能性があります。")
 
         # Save proposal to files
         try:
-            with open(proposal_txt_path, "w", encoding="utf-8") as f:
-                f.write(proposal_text)
+            await anyio.to_thread.run_sync(writer.commit, proposal_txt_path)
             logger.info(f"Proposal saved to {proposal_txt_path}")
-        except PermissionError as e:
-            logger.error(f"Permission denied when saving proposal to {proposal_txt_path}: {e}")
-            raise HTTPException(status_code=500, detail="提案ファイルの保存に失敗しました（権限エラー）")
-        except OSError as e:
-            logger.error(f"OS error when saving proposal to {proposal_txt_path}: {e}")
-            raise HTTPException(status_code=500, detail=f"提案ファイルの保存に失敗しました: {str(e)}")
         except Exception as e:
-            logger.error(f"Unexpected error saving proposal to {proposal_txt_path}: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"提案ファイルの保存中にエラーが発生しました: {str(e)}")
+            writer.discard()
+            raise _proposal_save_error(proposal_txt_path, e)
         
         try:
-            with open(proposal_md_path, "w", encoding="utf-8") as f:
-                f.write(proposal_text)
+            await anyio.to_thread.run_sync(_mirror_file, proposal_txt_path, proposal_md_path)
             logger.info(f"Proposal saved to {proposal_md_path}")
         except Exception as e:
             logger.warning(f"Failed to save markdown proposal file {proposal_md_path}: {e}")
@@ -1079,22 +1621,22 @@ def create_proposal(company: str) -> Dict[str, Any]:
         
         # Clean up progress file
         try:
-            if os.path.exists(progress_file):
-                os.remove(progress_file)
+            await anyio.to_thread.run_sync(_remove_if_exists, progress_file)
         except Exception as e:
             logger.warning(f"Failed to remove progress file {progress_file}: {e}")
 
-        return {"proposal": proposal_text}
+        # The body is only materialised once, for the caller
+        proposal_text = await anyio.to_thread.run_sync(_read_text_or_none, proposal_txt_path)
+        return proposal_text or ""
     except HTTPException:
         raise  # Re-raise HTTP exceptions
     except Exception as e:
-        logger.error(f"Unexpected error in create_proposal for {company}: {str(e)}", exc_info=True)
+        logger.error(f"Unexpected error in proposal creation for {company}: {str(e)}", exc_info=True)
         # Clean up progress file on error
         try:
             progress_file = os.path.join(company_dir(company), f"{company}_proposal_progress.json")
             if os.path.exists(progress_file):
-                with open(progress_file, "w", encoding="utf-8") as f:
-                    json.dump({"current": 0, "total": 0, "status": "error", "message": str(e)}, f)
+                await _update_progress(progress_file, {"current": 0, "total": 0, "status": "error", "message": str(e)}, final=True)
         except Exception:
             pass
         raise HTTPException(status_code=500, detail=f"提案作成中に予期しないエラーが発生しました: {str(e)}")
@@ -1103,29 +1645,28 @@ def create_proposal(company: str) -> Dict[str, Any]:
 # ----------------------
 # Disk state helpers
 # ----------------------
-def _marker_paths(company: str) -> Dict[str, str]:
-    d = company_dir(company)
-    return {
-        "running": os.path.join(d, ".running"),
-        "heartbeat": os.path.join(d, ".heartbeat"),
-        "done": os.path.join(d, ".done"),
-        "aborted": os.path.join(d, ".aborted"),
-    }
-
-
-def _mtime(path: str) -> Optional[float]:
-    try:
-        return os.path.getmtime(path)
-    except Exception:
-        return None
+# Marker file name -> key in the returned "ts" dict
+_MARKER_NAMES = {".running": "running", ".heartbeat": "heartbeat", ".done": "done", ".aborted": "aborted"}
 
 
 def _read_disk_state(company: str) -> Dict[str, Any]:
-    paths = _marker_paths(company)
-    ts_running = _mtime(paths["running"]) or 0.0
-    ts_hb = _mtime(paths["heartbeat"]) or 0.0
-    ts_done = _mtime(paths["done"]) or 0.0
-    ts_aborted = _mtime(paths["aborted"]) or 0.0
+    # One directory read instead of a stat() per marker file
+    ts = dict.fromkeys(_MARKER_NAMES.values(), 0.0)
+    try:
+        with os.scandir(company_dir(company)) as it:
+            for e in it:
+                key = _MARKER_NAMES.get(e.name)
+                if key is not None:
+                    try:
+                        ts[key] = e.stat().st_mtime
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+    ts_running = ts["running"]
+    ts_hb = ts["heartbeat"]
+    ts_done = ts["done"]
+    ts_aborted = ts["aborted"]
 
     now = time.time()
     run_age = now - ts_running if ts_running else None
@@ -1137,7 +1678,7 @@ def _read_disk_state(company: str) -> Dict[str, Any]:
         "aborted": bool(ts_aborted),
         "hb_recent": hb_age is not None and hb_age <= HEARTBEAT_STALE_SECONDS,
         "run_age_ok": run_age is not None and run_age <= MAX_RUN_SECONDS,
-        "ts": {"running": ts_running, "heartbeat": ts_hb, "done": ts_done, "aborted": ts_aborted},
+        "ts": ts,
     }
 
 # ----------------------
@@ -1155,6 +1696,25 @@ def _result_paths(company: str, idx: int) -> Dict[str, str]:
         "history": os.path.join(base_dir, f"{base}_history.json"),
     }
 
+def _mirror_file(src: str, dst: str) -> None:
+    """Make ``dst`` a hard link to ``src`` (same bytes, no second write); copy where links are unsupported."""
+    try:
+        os.remove(dst)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _write_two(txt_path: str, md_path: str, text: str) -> None:
+    """Write identical .txt/.md result files with a single write."""
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    _mirror_file(txt_path, md_path)
+
+
 def _load_history(path: str) -> List[Dict[str, Any]]:
     if not os.path.exists(path):
         return []
@@ -1187,6 +1747,16 @@ def _append_history(path: str, text: str, markdown: str) -> None:
 # Dify Integration Functions (from sample_dify_connect.py)
 # ----------------------
 
+# Keep-alive (HTTP/2 when the server offers it) connection to the chat API, reused
+# across queries and retries. httpx does not retry on its own, so the manual
+# retry loop remains authoritative.
+_dify_chat_client = httpx.Client(
+    timeout=DIFY_TIMEOUT,
+    http2=True,
+    limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+)
+
+@functools.lru_cache(maxsize=256)
 def _dify_marker_paths(company: str) -> Tuple[str, str, str, str]:
     """Get marker file paths for a company."""
     base_dir = company_dir(company)
@@ -1221,12 +1791,27 @@ def _dify_init_markers(company: str) -> None:
     _dify_remove_silent(aborted)
     _dify_touch(running)
     _dify_touch(heartbeat)
+    _last_heartbeat[company] = time.monotonic()
+
+
+# Last heartbeat touch per company (only the job thread writes these)
+_last_heartbeat: Dict[str, float] = {}
 
 
 def _dify_touch_heartbeat(company: str) -> None:
-    """Update heartbeat marker file."""
+    """Update heartbeat marker file (debounced; readers only look at its mtime)."""
+    now = time.monotonic()
+    last = _last_heartbeat.get(company)
+    if last is not None and now - last < HEARTBEAT_DEBOUNCE_SECONDS:
+        return
+    _last_heartbeat[company] = now
     _, heartbeat, _, _ = _dify_marker_paths(company)
-    _dify_touch(heartbeat)
+    try:
+        os.utime(heartbeat, None)  # one syscall instead of open/write/close
+    except FileNotFoundError:
+        _dify_touch(heartbeat)
+    except Exception:
+        pass
 
 
 def _dify_mark_done(company: str) -> None:
@@ -1245,16 +1830,17 @@ def _dify_mark_aborted(company: str) -> None:
     _dify_remove_silent(heartbeat)
 
 
-def _dify_stream_once(company: str, query: str, conversation_id: Optional[str]) -> Tuple[Optional[str], str]:
-    """Stream a single query to Dify chat API and return conversation_id and answer."""
+def _dify_stream_once(
+    company: str, query: str, conversation_id: Optional[str]
+) -> Tuple[Optional[str], str, Optional[float]]:
+    """Stream a single query to Dify chat API and return conversation_id, answer and rate-limit wait.
+
+    The wait is set only when Dify answered 429: its Retry-After, or
+    DIFY_INTER_QUERY_DELAY_SECONDS when the header is missing.
+    """
     if not DIFY_API_KEY1:
         raise ValueError("DIFY_API_KEY1 is not set")
 
-    headers = {
-        "Authorization": f"Bearer {DIFY_API_KEY1}",
-        "Content-Type": "application/json",
-    }
-
     payload = {
         "inputs": {"Company": company},
         "query": query,
@@ -1267,23 +1853,32 @@ def _dify_stream_once(company: str, query: str, conversation_id: Optional[str])
     new_conv_id = conversation_id
 
     try:
-        with requests.post(
-            DIFY_CHAT_ENDPOINT, headers=headers, json=payload, stream=True, timeout=DIFY_TIMEOUT
+        with _dify_chat_client.stream(
+            "POST", DIFY_CHAT_ENDPOINT, headers=DIFY_CHAT_HEADERS, json=payload
         ) as r:
+            if r.status_code == 429:
+                retry_after = _retry_after_seconds(r.headers.get("Retry-After"))
+                return conversation_id, "", float(DIFY_INTER_QUERY_DELAY_SECONDS) if retry_after is None else retry_after
             if r.status_code != 200:
-                return conversation_id, ""
+                return conversation_id, "", None
 
             last_hb = 0.0
-            for raw in r.iter_lines(decode_unicode=True):
-                if not raw:
-                    continue
-                if not raw.startswith("data:"):
-                    continue
-                data = raw[5:].strip()
-                if data == "[DONE]":
+            for data in _iter_sse_data(r):
+                if data == b"[DONE]":
                     break
+                # Update heartbeat every 15 seconds (pings included, they mark a live stream)
+                now = time.time()
+                if now - last_hb >= 15.0:
+                    try:
+                        _dify_touch_heartbeat(company)
+                    except Exception:
+                        pass
+                    last_hb = now
+                # message_end repeats the conversation_id, so it is only skipped once that is known
+                if _is_skipped_event(data) and (new_conv_id or b'"conversation_id"' not in data):
+                    continue
                 try:
-                    evt = json.loads(data)
+                    evt = orjson.loads(data)
                 except Exception:
                     continue
 
@@ -1296,19 +1891,21 @@ def _dify_stream_once(company: str, query: str, conversation_id: Optional[str])
                         answer_parts.append(ans)
                     elif evt.get("event") == "error" and evt.get("message"):
                         pass  # Error handling can be added here if needed
+    except httpx.HTTPError:
+        return conversation_id, "", None
+
+    return new_conv_id, "".join(answer_parts), None
 
-                # Update heartbeat every 15 seconds
-                now = time.time()
-                if now - last_hb >= 15.0:
-                    try:
-                        _dify_touch_heartbeat(company)
-                    except Exception:
-                        pass
-                    last_hb = now
-    except RequestException:
-        return conversation_id, ""
 
-    return new_conv_id, "".join(answer_parts)
+def _dify_wait(company: str, seconds: float) -> None:
+    """Sleep between attempts, keeping the heartbeat fresh through long rate-limit waits."""
+    deadline = time.monotonic() + seconds
+    while (remaining := deadline - time.monotonic()) > 0:
+        time.sleep(min(remaining, 15.0))
+        try:
+            _dify_touch_heartbeat(company)
+        except Exception:
+            pass
 
 
 def _run_dify_queries(company: str, indices: List[int]) -> None:
@@ -1320,27 +1917,33 @@ def _run_dify_queries(company: str, indices: List[int]) -> None:
 
     conv_id: Optional[str] = None
     job_completed = False
+    # Result files are written on a single worker so the next request starts right away;
+    # one worker keeps the writes in query order
+    saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reach-save")
 
     try:
         for idx, i in enumerate(indices, 1):
             q = QUERIES[i - 1]
 
-            # Update heartbeat
-            try:
-                _dify_touch_heartbeat(company)
-            except Exception:
-                pass
+            # Heartbeats come from the stream loop in _dify_stream_once
 
             # Retry logic
             answer_text = ""
             new_conv_id: Optional[str] = conv_id
+            prev_wait = float(DIFY_RETRY_BACKOFF_SECONDS)
+            rate_limit_wait: Optional[float] = None
             for attempt in range(1, DIFY_MAX_RETRIES + 1):
-                new_conv_id, answer_text = _dify_stream_once(company, q, new_conv_id)
+                new_conv_id, answer_text, rate_limit_wait = _dify_stream_once(company, q, new_conv_id)
                 if answer_text.strip():
                     break
-                # Exponential backoff on failure
-                backoff = DIFY_RETRY_BACKOFF_SECONDS * attempt
-                time.sleep(backoff)
+                # Wait as told on 429, otherwise jittered backoff (no wait after the last attempt)
+                if attempt < DIFY_MAX_RETRIES:
+                    if rate_limit_wait is not None:
+                        _dify_wait(company, rate_limit_wait)
+                        rate_limit_wait = None
+                    else:
+                        prev_wait = _backoff(prev_wait, DIFY_RETRY_BACKOFF_SECONDS)
+                        _dify_wait(company, prev_wait)
 
             if answer_text.strip():
                 conv_id = new_conv_id
@@ -1349,22 +1952,17 @@ def _run_dify_queries(company: str, indices: List[int]) -> None:
             base = f"{company}_{i}"
             txt_path = os.path.join(out_dir, f"{base}.txt")
             md_path = os.path.join(out_dir, f"{base}.md")
-            try:
-                with open(txt_path, "w", encoding="utf-8") as f_txt:
-                    f_txt.write(answer_text)
-            except Exception:
-                pass
-            try:
-                with open(md_path, "w", encoding="utf-8") as f_md:
-                    f_md.write(answer_text)
-            except Exception:
-                pass
+            # Failures are ignored as before (the future's exception is never read)
+            saver.submit(_write_two, txt_path, md_path, answer_text)
 
-            # Delay between queries
-            time.sleep(DIFY_INTER_QUERY_DELAY_SECONDS)
+            # No fixed delay between queries: pace only when Dify rate-limited the last attempt
+            if rate_limit_wait is not None:
+                _dify_wait(company, rate_limit_wait)
 
         job_completed = True
     finally:
+        # Every result is on disk before .done/.aborted is written
+        saver.shutdown(wait=True)
         try:
             if job_completed:
                 _dify_mark_done(company)
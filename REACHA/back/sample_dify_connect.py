@@ -20,6 +20,7 @@ import time
 from typing import Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
 # =========================
@@ -38,7 +39,12 @@ TIMEOUT = 10800
 # 実行制御（連続実行・失敗時の再試行）
 MAX_RETRIES = 3
 RETRY_BACKOFF_SECONDS = 10  # 再試行ごとに attempt * この秒数だけ待機
-INTER_QUERY_DELAY_SECONDS = 8  # クエリ間の待機（Dify側の安定化用）
+INTER_QUERY_DELAY_SECONDS = 8  # 429 で Retry-After が無い場合の待機秒（クエリ間の固定待機はしない）
+
+# 接続の使い回し（クエリ・再試行ごとのTCP/TLSハンドシェイクを省略）
+# 再試行は自前のループで行うため、アダプタ側の再試行は無効
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
 
 # 固定クエリリスト（必要に応じて編集可）
 QUERIES = [
@@ -103,7 +109,8 @@ def _mark_aborted(company: str) -> None:
     _remove_silent(heartbeat)
 
 
-def stream_once(company: str, query: str, conversation_id: Optional[str]) -> Tuple[Optional[str], str]:
+def stream_once(company: str, query: str, conversation_id: Optional[str]) -> Tuple[Optional[str], str, Optional[float]]:
+    """1クエリを送信し (conversation_id, 回答, 429時の待機秒 or None) を返す"""
     payload = {
         # アプリの入力変数
         "inputs": {"Company": company},
@@ -120,12 +127,17 @@ def stream_once(company: str, query: str, conversation_id: Optional[str]) -> Tup
     new_conv_id = conversation_id
 
     try:
-        with requests.post(
+        with SESSION.post(
             API_ENDPOINT, headers=HEADERS, json=payload, stream=True, timeout=TIMEOUT
         ) as r:
+            if r.status_code == 429:
+                retry_after = (r.headers.get("Retry-After") or "").strip()
+                wait = float(retry_after) if retry_after.isdigit() else float(INTER_QUERY_DELAY_SECONDS)
+                sys.stderr.write(f"HTTP 429: rate limited, wait {wait:.0f}s\n")
+                return conversation_id, "", wait
             if r.status_code != 200:
                 sys.stderr.write(f"HTTP {r.status_code}: {r.text}\n")
-                return conversation_id, ""
+                return conversation_id, "", None
 
             last_hb = 0.0
             for raw in r.iter_lines(decode_unicode=True):
@@ -166,7 +178,7 @@ def stream_once(company: str, query: str, conversation_id: Optional[str]) -> Tup
         sys.stderr.write(f"request error: {e}\n")
 
     print()  # 各クエリ後に改行
-    return new_conv_id, "".join(answer_parts)
+    return new_conv_id, "".join(answer_parts), None
 
 
 def main() -> None:
@@ -183,7 +195,7 @@ def main() -> None:
         "--retry-backoff", type=int, default=RETRY_BACKOFF_SECONDS, help="リトライ間隔の基準秒 (既定: 10)"
     )
     ap.add_argument(
-        "--inter-delay", type=int, default=INTER_QUERY_DELAY_SECONDS, help="クエリ間待機秒 (既定: 8)"
+        "--inter-delay", type=int, default=INTER_QUERY_DELAY_SECONDS, help="429でRetry-Afterが無い場合の待機秒 (既定: 8)"
     )
     ap.add_argument('--indices', default='', help='1始まりのカンマ区切り (例: 1,3,5)')
     args = ap.parse_args()
@@ -204,9 +216,9 @@ def main() -> None:
     # 実行対象のインデックス決定（デフォルトは全件）
     indices = list(range(1, len(QUERIES) + 1))
     if args.indices.strip():
-        raw = [s.strip() for s in args.indices.split(',') if s.strip()]
-        cand = sorted({int(s) for s in raw if s.isdigit()})
-        indices = [i for i in cand if 1 <= i <= len(QUERIES)] or indices
+        # 1パスで数値化・範囲チェック・重複除去（実行順は従来どおり昇順）
+        cand = {i for i in (int(s) for s in args.indices.split(',') if s.strip().isdigit()) if 1 <= i <= len(QUERIES)}
+        indices = sorted(cand) or indices
 
     print(f"Company={args.company} で {len(indices)} 件を送信します。\n")
 
@@ -218,23 +230,23 @@ def main() -> None:
             print(f"[{idx}/{len(indices)}] Q: {q}")
             print("A: ", end="")
 
-            # ハートビート先出し
-            try:
-                _touch_heartbeat(args.company)
-            except Exception:
-                pass
+            # ハートビートは stream_once 内のストリーム受信時に更新
 
             # 再試行つきで取得
             answer_text = ""
             new_conv_id: Optional[str] = conv_id
+            rate_limit_wait: Optional[float] = None
             for attempt in range(1, MAX_RETRIES + 1):
-                new_conv_id, answer_text = stream_once(args.company, q, new_conv_id)
+                new_conv_id, answer_text, rate_limit_wait = stream_once(args.company, q, new_conv_id)
                 if answer_text.strip():
                     break
-                # 空応答やエラー時は指数バックオフ
-                backoff = RETRY_BACKOFF_SECONDS * attempt
-                sys.stderr.write(f"empty or failed response, retry in {backoff}s (attempt {attempt}/{MAX_RETRIES})\n")
-                time.sleep(backoff)
+                # 最終試行の後は待たない（429 の待機はクエリ後の待機に引き継ぐ）
+                if attempt < MAX_RETRIES:
+                    # 429 はサーバー指定の秒数、それ以外の空応答やエラー時はバックオフ
+                    backoff = rate_limit_wait if rate_limit_wait is not None else RETRY_BACKOFF_SECONDS * attempt
+                    rate_limit_wait = None
+                    sys.stderr.write(f"empty or failed response, retry in {backoff:.0f}s (attempt {attempt}/{MAX_RETRIES})\n")
+                    time.sleep(backoff)
             # 応答が得られた場合のみ会話IDを更新
             if answer_text.strip():
                 conv_id = new_conv_id
@@ -255,8 +267,9 @@ def main() -> None:
             except Exception:
                 sys.stderr.write(f"MD保存に失敗しました: {md_path}\n")
 
-            # 次のクエリまで少し待機（連続実行を避ける）
-            time.sleep(INTER_QUERY_DELAY_SECONDS)
+            # 固定のクエリ間待機はせず、直前が 429 だった場合のみ待機
+            if rate_limit_wait is not None:
+                time.sleep(rate_limit_wait)
 
         job_completed = True
     finally:
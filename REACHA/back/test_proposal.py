@@ -4,22 +4,335 @@
 Test script for proposal creation API
 """
 
+import io
 import os
 import sys
-import requests
-import json
+import queue
+import threading
+import httpx
+import orjson
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+try:  # Optional: pip install pysimdjson
+    import simdjson
+except ImportError:
+    simdjson = None
+
+if simdjson is not None:
+    # One parser for the whole stream so its tape and string buffers are reused. A
+    # document stays valid only until the next parse, so only leaf values (copied out
+    # as Python str by at_pointer) are kept around. The default max_capacity is kept:
+    # a workflow_finished frame carries the whole proposal and may exceed 1 MiB.
+    _PARSER = simdjson.Parser()
+    _OBJECT_TYPES = (dict, simdjson.Object)
+
+    def parse_event(data):
+        # Lazy proxies: nothing is materialized beyond what pointer() asks for
+        # simdjson copies into its padded buffer anyway, so the view is copied here
+        return _PARSER.parse(bytes(data), recursive=False)
+
+    def pointer(doc, path):
+        """Value at JSON pointer ``path``, or None; sub-trees are never materialized."""
+        try:
+            return doc.at_pointer(path)
+        except (AttributeError, KeyError, IndexError, TypeError, ValueError):
+            return None
+
+    def to_plain(doc):
+        if isinstance(doc, simdjson.Object):
+            return doc.as_dict()
+        if isinstance(doc, simdjson.Array):
+            return doc.as_list()
+        return doc
+else:
+    _OBJECT_TYPES = (dict,)
+    parse_event = orjson.loads
+
+    def pointer(doc, path):
+        """Value at JSON pointer ``path``, or None (orjson fallback walks the dicts)."""
+        for key in path[1:].split("/"):
+            if not isinstance(doc, dict):
+                return None
+            doc = doc.get(key)
+        return doc
+
+    def to_plain(doc):
+        return doc
+
+
+def _peek(s, n=80):
+    """Debug preview of ``s`` (str, bytes or memoryview): sliced only when longer than ``n``."""
+    cut = len(s) > n
+    head = s[:n] if cut else s
+    if not isinstance(head, str):
+        head = bytes(head).decode("utf-8", errors="replace")
+    return head + "..." if cut else head
+
+
+def _frame_line(line, start, end, out):
+    """Append what ``line[start:end]`` contributes to ``out``.
+
+    A ``data:`` payload worth parsing (or ``[DONE]``) is appended as a memoryview
+    into ``line``, so no per-line bytes object is created; ``line`` is an immutable
+    chunk and stays valid wherever the view travels. Any other line is only kept
+    (as ``bytes``) when debugging.
+    """
+    if end > start and line[end - 1] == 0x0D:  # CRLF framing
+        end -= 1
+    if start == end:
+        return
+    if not line.startswith(_DATA_PREFIX, start, end):
+        if DEBUG:
+            out.append(line[start:end])
+        return
+    start += len(_DATA_PREFIX)
+    while start < end and line[start] in (0x20, 0x09):
+        start += 1
+    if not (DEBUG or line.startswith(_DONE, start, end)
+            or any(line.find(m, start, end) >= 0 for m in _TARGET_MARKERS)):
+        return  # ping / node status events
+    out.append(memoryview(line)[start:end])
+
+
+def iter_sse_batches(r, chunk_size=65536):
+    """Yield the framed lines of a streaming response in linear time, one list per chunk.
+
+    Unlike ``iter_lines``, pieces of a long line are only kept in a list and joined
+    once its newline arrives, instead of re-concatenating the pending bytes per chunk;
+    lines inside a single chunk are scanned in place by offset.
+    """
+    pending = []
+    for chunk in r.iter_bytes(chunk_size=chunk_size):
+        out = []
+        start = 0
+        while (idx := chunk.find(b"\n", start)) >= 0:
+            if pending:
+                pending.append(chunk[start:idx])
+                line = b"".join(pending)
+                pending.clear()
+                _frame_line(line, 0, len(line), out)
+            else:
+                _frame_line(chunk, start, idx, out)
+            start = idx + 1
+        if start < len(chunk):
+            pending.append(chunk[start:])
+        if out:
+            yield out
+    if pending:
+        line = b"".join(pending)
+        out = []
+        _frame_line(line, 0, len(line), out)
+        if out:
+            yield out
+
+
+def _read_lines(r, q, stop, poll=0.1):
+    """Producer: network read and line splitting, off the parsing thread.
+
+    Lines are queued per chunk to keep queue overhead per line low; ``None`` marks
+    the end of the stream and an exception is handed over for the consumer to raise.
+    Puts time out every ``poll`` seconds to check ``stop``, so a consumer that quit
+    early never leaves this thread blocked on a full queue.
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=poll)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for lines in iter_sse_batches(r):
+            if not put(lines):
+                return
+    except Exception as e:
+        put(e)
+    else:
+        put(None)
+
+
+def iter_sse_lines(r, maxsize=256):
+    """Framed lines of ``r`` read by a producer thread while the caller parses.
+
+    However the caller stops (end of stream, break, exception, KeyboardInterrupt),
+    the producer is told to stop and joined before this generator finishes. If it
+    is blocked in a read, ``r`` is closed to make that read fail right away.
+    """
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    producer = threading.Thread(target=_read_lines, args=(r, q, stop), daemon=True)
+    producer.start()
+    try:
+        for lines in iter(q.get, None):
+            if isinstance(lines, Exception):
+                raise lines
+            yield from lines
+    finally:
+        stop.set()
+        # Drain so a pending put returns; a producer still parked in a read is cut
+        # off by closing the response, instead of waiting out the read timeout
+        closed = False
+        while producer.is_alive():
+            try:
+                while True:
+                    q.get_nowait()
+            except queue.Empty:
+                pass
+            producer.join(timeout=0.1)
+            if producer.is_alive() and not closed:
+                r.close()
+                closed = True
+
+# Load environment variables; .env is read once per process tree (children inherit it)
+if not os.getenv("REACHA_ENV_LOADED"):
+    load_dotenv()
+    os.environ["REACHA_ENV_LOADED"] = "1"
 
 DIFY_API_KEY2 = os.getenv("DIFY_API_KEY2")
 DIFY_USER_ID = os.getenv("DIFY_USER_ID", "REACHA_agent")
 DIFY_TIMEOUT = int(os.getenv("DIFY_TIMEOUT", "10800"))
 DIFY_WORKFLOW_ENDPOINT = "https://api.dify.ai/v1/workflows/run"
+# Per-event output is only printed with REACHA_DEBUG=1; it would otherwise throttle the stream reader
+DEBUG = os.getenv("REACHA_DEBUG") == "1"
+_DATA_PREFIX = b"data:"
+_DONE = b"[DONE]"
+# Only payloads containing one of these can contribute text; the rest are never parsed
+_TARGET_MARKERS = (b'"text_chunk"', b'"workflow_finished"', b'"answer"', b'"output"')
+# Preferred workflow_finished output fields with their pointers, built once
+_CANDIDATES = tuple((key, f"/{key}") for key in ("text", "answer", "output", "result"))
+
+# Block-buffer stdout in 64 KiB blocks instead of flushing every line (each flush is a
+# write() syscall, per line when stdout goes to a log collector); flushed once at the end
+if isinstance(getattr(sys.stdout, "buffer", None), io.BufferedWriter):
+    sys.stdout = io.TextIOWrapper(
+        io.BufferedWriter(sys.stdout.buffer.raw, buffer_size=1 << 16),
+        encoding=sys.stdout.encoding,
+        errors=sys.stdout.errors,
+        write_through=False,
+    )
+else:
+    sys.stdout.reconfigure(line_buffering=False, write_through=False)
+
+# Stream-time output is written as bytes straight to the binary stdout, skipping the
+# text encoder for the fixed parts; only the previews are encoded. print() output
+# must be flushed into the same buffer first (see the streaming block).
+_OUT = sys.stdout.buffer
+_WF_FINISHED_MSG = b"  -> workflow_finished detected\n"
+_KEYS_FMT = b"  -> outputs keys: %s\n"
+_FOUND_FMT = b"  -> Found %s: %s\n"
+_TEXT_CHUNK_FMT = b"  -> text_chunk: %s\n"
+_ANSWER_FMT = b"  -> answer chunk: %s\n"
+_OUTPUT_FMT = b"  -> output chunk: %s\n"
+_RAW_FMT = b"[RAW] %s\n"
+_DONE_MSG = b"\n[DONE] signal received\n"
+_JSON_ERROR_FMT = b"[JSON Error] %s: %s\n"
+_EVT_FMT = b"\n[Event #%d] type=%s\n"
+_FULL_EVENT_FMT = b"  -> Full event: %s\n"
+_ERROR_FMT = b"[Error] %s: %s\n"
+
+
+def _on_workflow_finished(evt, buf):
+    """Append the final output; True once it was found, which ends the stream."""
+    if DEBUG:
+        _OUT.write(_WF_FINISHED_MSG)
+    outputs = pointer(evt, "/data/outputs")
+    if isinstance(outputs, _OBJECT_TYPES):
+        if DEBUG:
+            _OUT.write(_KEYS_FMT % str(list(outputs.keys())).encode("utf-8"))
+        for key, path in _CANDIDATES:
+            value = pointer(outputs, path)
+            if isinstance(value, str) and value.strip():
+                if DEBUG:
+                    _OUT.write(_FOUND_FMT % (key.encode("utf-8"), _peek(value, 100).encode("utf-8")))
+                buf += value.encode("utf-8")
+                return True
+    return False
+
+
+def _on_text_chunk(evt, buf):
+    text = pointer(evt, "/text")
+    if isinstance(text, str) and text:
+        if DEBUG:
+            _OUT.write(_TEXT_CHUNK_FMT % _peek(text, 50).encode("utf-8"))
+        buf += text.encode("utf-8")
+
+
+def _on_other(evt, buf):
+    """Any other event: a streamed ``answer`` or ``output`` at the top level."""
+    if (ans := pointer(evt, "/answer")) is not None:
+        if DEBUG:
+            _OUT.write(_ANSWER_FMT % _peek(ans, 50).encode("utf-8"))
+        buf += ans.encode("utf-8")
+    elif (out := pointer(evt, "/output")) is not None:
+        if DEBUG:
+            _OUT.write(_OUTPUT_FMT % _peek(out, 50).encode("utf-8"))
+        buf += out.encode("utf-8")
+
+
+# Handler per event type; one dict lookup per event instead of an if/elif chain
+_DISPATCH = {
+    "workflow_finished": _on_workflow_finished,
+    "text_chunk": _on_text_chunk,
+}
+
+
+def sse_payloads(r):
+    """``data:`` payloads of the stream worth parsing (memoryviews), up to ``[DONE]``.
+
+    Prefix, whitespace and target-marker checks already ran in the framer; only
+    non-data lines (``bytes``, forwarded in DEBUG mode) are left to report here.
+    Closing this generator closes the line reader, which stops its producer thread.
+    """
+    lines = iter_sse_lines(r)
+    try:
+        for item in lines:
+            if type(item) is bytes:
+                _OUT.write(_RAW_FMT % _peek(item, 100).encode("utf-8"))
+                continue
+            if item == _DONE:
+                _OUT.write(_DONE_MSG)
+                return
+            yield item
+    finally:
+        lines.close()
+
+
+def handle_event(data, buf, number, dump=False):
+    """Parse one payload and append its text to ``buf``.
+
+    Returns ``(parsed, final)``: whether the payload was an event, and whether it
+    delivered the final workflow output, after which nothing more is needed.
+
+    The parsed document only lives in this frame, so it is released before the
+    shared simdjson parser is reused for the next payload.
+    """
+    try:
+        evt = parse_event(data)
+    except ValueError as e:  # orjson.JSONDecodeError and simdjson parse errors
+        _OUT.write(_JSON_ERROR_FMT % (str(e).encode("utf-8"), _peek(data, 100).encode("utf-8")))
+        return False, False
+    final = False
+    try:
+        event_type = pointer(evt, "/event")
+        if not isinstance(event_type, str):
+            event_type = "unknown"
+        if DEBUG:
+            _OUT.write(_EVT_FMT % (number, event_type.encode("utf-8")))
+        
+        final = _DISPATCH.get(event_type, _on_other)(evt, buf) is True
+        
+        # Show event structure for debugging
+        if dump:
+            _OUT.write(_FULL_EVENT_FMT % orjson.dumps(to_plain(evt), option=orjson.OPT_INDENT_2))
+    except Exception as e:
+        _OUT.write(_ERROR_FMT % (str(e).encode("utf-8"), _peek(data, 100).encode("utf-8")))
+    return True, final
 
 if not DIFY_API_KEY2:
     print("ERROR: DIFY_API_KEY2 is not set in .env file")
+    sys.stdout.flush()
     sys.exit(1)
 
 # Test data (sample research output)
@@ -44,91 +357,63 @@ payload = {
     "response_mode": "streaming",
     "user": DIFY_USER_ID,
 }
+# Serialized once in C; sent as-is (headers already carry the JSON Content-Type)
+body = orjson.dumps(payload)
 
 print("Sending request...")
-print(f"Payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+if __debug__ and DEBUG:  # stripped entirely under python -O
+    print(f"Payload: {orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode()}")
 print("-" * 60)
 
 try:
-    with requests.post(
-        DIFY_WORKFLOW_ENDPOINT, headers=headers, json=payload, stream=True, timeout=DIFY_TIMEOUT
+    # One HTTP/2 client, so the TLS handshake is paid once for everything sent through it
+    with httpx.Client(http2=True, timeout=DIFY_TIMEOUT) as client, client.stream(
+        "POST", DIFY_WORKFLOW_ENDPOINT, headers=headers, content=body
     ) as r:
-        print(f"Status Code: {r.status_code}")
+        print(f"Status Code: {r.status_code} ({r.http_version})")
         
         if r.status_code != 200:
+            r.read()
             print(f"ERROR: {r.text}")
             sys.exit(1)
         
         print("\nStreaming response:")
         print("-" * 60)
         
-        proposal_parts = []
+        proposal_buf = bytearray()  # UTF-8 bytes, decoded once at the end
+        sys.stdout.flush()  # pending print() text goes out before the raw _OUT writes
         event_count = 0
         
-        for raw in r.iter_lines(decode_unicode=True):
-            if not raw:
-                continue
-            if not raw.startswith("data:"):
-                print(f"[RAW] {raw[:100]}")
-                continue
-            
-            data = raw[5:].strip()
-            if data == "[DONE]":
-                print("\n[DONE] signal received")
-                break
-            
-            try:
-                evt = json.loads(data)
-                event_count += 1
-                event_type = evt.get("event", "unknown")
-                print(f"\n[Event #{event_count}] type={event_type}")
-                
-                if isinstance(evt, dict):
-                    # Handle workflow_finished
-                    if event_type == "workflow_finished":
-                        print("  -> workflow_finished detected")
-                        data_obj = evt.get("data")
-                        if isinstance(data_obj, dict):
-                            outputs = data_obj.get("outputs")
-                            if isinstance(outputs, dict):
-                                print(f"  -> outputs keys: {list(outputs.keys())}")
-                                for key in ("text", "answer", "output", "result"):
-                                    value = outputs.get(key)
-                                    if isinstance(value, str) and value.strip():
-                                        print(f"  -> Found {key}: {value[:100]}...")
-                                        proposal_parts.append(value)
-                                        break
-                    
-                    # Handle text_chunk events
-                    elif event_type == "text_chunk":
-                        text = evt.get("text")
-                        if isinstance(text, str) and text:
-                            print(f"  -> text_chunk: {text[:50]}...")
-                            proposal_parts.append(text)
-                    
-                    # Handle streaming answer
-                    elif "answer" in evt:
-                        ans = evt["answer"]
-                        print(f"  -> answer chunk: {ans[:50]}...")
-                        proposal_parts.append(ans)
-                    elif "output" in evt:
-                        out = evt["output"]
-                        print(f"  -> output chunk: {out[:50]}...")
-                        proposal_parts.append(out)
-                    
-                    # Show event structure for debugging
-                    if event_count <= 3:  # Show first 3 events in detail
-                        print(f"  -> Full event: {json.dumps(evt, ensure_ascii=False, indent=4)}")
-                
-            except json.JSONDecodeError as e:
-                print(f"[JSON Error] {e}: {data[:100]}")
-            except Exception as e:
-                print(f"[Error] {e}: {data[:100]}")
+        # Raw bytes go straight to orjson, which decodes UTF-8 itself
+        payloads = sse_payloads(r)
+        final = False
+        try:
+            # Preamble: the first 3 events, shown in full when debugging
+            for data in payloads:
+                parsed, final = handle_event(data, proposal_buf, event_count + 1, dump=__debug__ and DEBUG)
+                event_count += parsed
+                if final or event_count == 3:
+                    break
+            # Steady state: the rest of the stream, without the dump check
+            if not final:
+                for data in payloads:
+                    parsed, final = handle_event(data, proposal_buf, event_count + 1)
+                    event_count += parsed
+                    if final:
+                        break
+        finally:
+            # Stop the producer thread before the with block closes r and the client
+            payloads.close()
+        if final:
+            # Trailing events add nothing; the reader is stopped and leaving the block closes r
+            print("\n[workflow_finished] final output received")
         
+        if not DEBUG:
+            print(f"Received {event_count} events")
         print("\n" + "=" * 60)
         print("FINAL RESULT:")
         print("=" * 60)
-        proposal_text = "".join(proposal_parts)
+        proposal_text = proposal_buf.decode("utf-8")
         
         if proposal_text.strip():
             print(f"Success! Proposal length: {len(proposal_text)} characters")
@@ -144,10 +429,12 @@ try:
             print("  2. The workflow is not configured correctly")
             print("  3. The API key might be incorrect")
 
-except requests.exceptions.RequestException as e:
+except httpx.HTTPError as e:
     print(f"ERROR: Request failed: {e}")
     sys.exit(1)
 except KeyboardInterrupt:
     print("\n\nInterrupted by user")
     sys.exit(1)
+finally:
+    sys.stdout.flush()
 